@@ -0,0 +1,107 @@
+"""
+Asset registry with indexed symbol, id and precision lookups.
+
+Loaded once from the precision cache, it gives O(1) lookups by instance
+number, "1.3.x" id or symbol (exact or case-insensitive) and sorted prefix
+search for the GUI, so routing, quoting and rendering no longer build
+f"1.3.{id}" strings or scan the whole cache.
+"""
+
+from bisect import bisect_left
+
+
+class Asset:
+    """
+    One asset; object holds the full chain object once fetched, for quoting
+    """
+
+    __slots__ = ("id", "instance", "symbol", "precision", "scale", "object")
+
+    def __init__(self, asset_id, symbol, precision, obj=None):
+        self.id = asset_id
+        self.instance = int(asset_id.rsplit(".", 1)[1])
+        self.symbol = symbol
+        self.precision = int(precision)
+        self.scale = 10**self.precision
+        self.object = obj
+
+    def __repr__(self):
+        return f"Asset({self.id}, {self.symbol}, {self.precision})"
+
+
+class AssetRegistry:
+    """
+    Indexes over every known asset
+    """
+
+    def __init__(self, cache):
+        self.by_instance = {}
+        self.by_id = {}
+        self.by_symbol = {}
+        self.by_upper = {}
+        for asset_id, info in cache.items():
+            obj = info if "options" in info else None
+            asset = Asset(asset_id, info["symbol"], info["precision"], obj)
+            self.by_instance[asset.instance] = asset
+            self.by_id[asset_id] = asset
+            self.by_symbol[asset.symbol] = asset
+            self.by_upper.setdefault(asset.symbol.upper(), asset)
+        self.upper_symbols = sorted(self.by_upper)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        asset = self.get(key)
+        if asset is None:
+            raise KeyError(key)
+        return asset
+
+    def get(self, key, default=None):
+        """
+        Look up by instance number, "1.3.x" id or exact symbol
+        """
+        if isinstance(key, int):
+            return self.by_instance.get(key, default)
+        return self.by_id.get(key) or self.by_symbol.get(key, default)
+
+    def find(self, symbol):
+        """
+        Case-insensitive symbol lookup, exact matches preferred
+        """
+        return self.by_symbol.get(symbol) or self.by_upper.get(symbol.upper())
+
+    def prefix(self, text, limit=10):
+        """
+        Up to limit assets whose symbol starts with text, case-insensitively
+        """
+        text = text.upper()
+        start = bisect_left(self.upper_symbols, text)
+        matches = []
+        for symbol in self.upper_symbols[start : start + limit]:
+            if not symbol.startswith(text):
+                break
+            matches.append(self.by_upper[symbol])
+        return matches
+
+    def symbol(self, instance):
+        asset = self.by_instance.get(instance)
+        return asset.symbol if asset is not None else str(instance)
+
+    def precisions(self):
+        """
+        A precision cache, keyed by "1.3.x", rebuilt from the records
+        """
+        return {
+            asset.id: asset.object or {"symbol": asset.symbol, "precision": asset.precision}
+            for asset in self.by_instance.values()
+        }
+
+    def attach_objects(self, objects):
+        """
+        Keep full chain objects (options, fees) on the records for quoting
+        """
+        for asset_id, obj in objects.items():
+            asset = self.by_id.get(asset_id)
+            if asset is not None and obj is not None and "options" in obj:
+                asset.object = obj
@@ -0,0 +1,113 @@
+"""
+Batch oracle feed prices for every market pegged asset.
+
+Instead of rpc_get_feed's three sequential calls per bitasset, every median
+feed is pulled in one pipelined batch of get_objects calls, cached until the
+head block moves, and exposed as an oracle price vector in core terms that
+routing can hold up against the pool prices.
+"""
+
+import numpy as np
+
+from rpc import rpc_get_objects, wss_query, wss_query_batch
+
+
+class FeedCache:
+    """
+    Median feeds of every bitasset, refreshed at most once per block
+    ~
+    feeds maps each MPA instance to (mpa units per backing unit, backing instance)
+    """
+
+    def __init__(self, limit=100):
+        self.limit = limit
+        self.block = None
+        self.feeds = {}
+
+    def refresh(self, rpc, assets):
+        """
+        Feeds for every bitasset in the registry, refetched when the block changes
+        """
+        head = wss_query(rpc, ["database", "get_dynamic_global_properties", []])
+        head = head["head_block_number"]
+        if head == self.block:
+            return self.feeds
+
+        data_ids = {
+            asset.object["bitasset_data_id"]: asset.instance
+            for asset in assets.by_instance.values()
+            if asset.object is not None and "bitasset_data_id" in asset.object
+        }
+        ids = list(data_ids)
+        chunks = [ids[i : i + self.limit] for i in range(0, len(ids), self.limit)]
+        results = wss_query_batch(rpc, [["database", "get_objects", [chunk]] for chunk in chunks])
+        bitassets = [item for result in results if result for item in result if item]
+
+        settlements = []
+        for data in bitassets:
+            feed = data.get("median_feed") or data.get("current_feed")
+            if feed is None:
+                continue
+            settlement = feed["settlement_price"]
+            if int(settlement["base"]["amount"]) and int(settlement["quote"]["amount"]):
+                settlements.append((data_ids[data["id"]], settlement))
+
+        # precisions come from the registry; fetch any unknown backing assets in one call
+        missing = {
+            side["asset_id"]
+            for _, settlement in settlements
+            for side in (settlement["base"], settlement["quote"])
+            if side["asset_id"] not in assets.by_id
+        }
+        objects = rpc_get_objects(rpc, list(missing)) if missing else {}
+
+        def scale(asset_id):
+            if asset_id in assets.by_id:
+                return assets.by_id[asset_id].scale
+            return 10 ** int(objects[asset_id]["precision"])
+
+        feeds = {}
+        for instance, settlement in settlements:
+            base, quote = settlement["base"], settlement["quote"]
+            if base["asset_id"] == assets.by_instance[instance].id:
+                mpa, backing = base, quote
+            else:
+                mpa, backing = quote, base
+            if backing["asset_id"] not in assets.by_id and backing["asset_id"] not in objects:
+                continue
+            feeds[instance] = (
+                (int(mpa["amount"]) / scale(mpa["asset_id"]))
+                / (int(backing["amount"]) / scale(backing["asset_id"])),
+                int(backing["asset_id"].rsplit(".", 1)[1]),
+            )
+
+        self.block = head
+        self.feeds = feeds
+        return feeds
+
+
+FEEDS = FeedCache()
+
+
+def oracle_prices(feeds, prices):
+    """
+    Oracle price vector in the units of a price table (asset units per core)
+    ~
+    returns (instances, oracle); feeds backed by an asset the table cannot
+    value come out as nan
+    """
+    instances = np.fromiter(feeds, dtype=np.int64, count=len(feeds))
+    ratio = np.array([feeds[instance][0] for instance in instances.tolist()], dtype=float)
+    backing_price = np.array(
+        [prices.get(feeds[instance][1], np.nan) for instance in instances.tolist()], dtype=float
+    )
+    return instances, ratio * backing_price
+
+
+def feed_premiums(instances, oracle, prices):
+    """
+    How far pool pricing sits from the oracle: positive means the pools price
+    the MPA above its feed (fewer MPA per core than the oracle)
+    """
+    pool = np.array([prices.get(instance, np.nan) for instance in instances.tolist()], dtype=float)
+    return oracle / pool - 1
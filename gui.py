@@ -1,173 +1,209 @@
-import itertools
 import json
-import queue
+import logging
+import math
 import subprocess
 import sys
 import threading
-import time
 import tkinter as tk
-from datetime import datetime, timedelta, timezone
+from collections import deque
 from tkinter import scrolledtext
 from tkinter.scrolledtext import ScrolledText
 
-from min_to_receive import wrapper
+from assets import AssetRegistry
+from poolmap import DEFAULT_PRUNE, load_precisions
 from poolmap import main as pathfind
-from rpc import get_account_by_name, rpc_get_objects, wss_handshake
+from rpc import HedgedRPC, RPCMultiplexer, get_account_by_name
+from sweep import amount_grid, sweep_route
+from transaction import build_transactions, save_transactions
 
 
-class StdoutRedirector:
-    """File-like object to replace sys.stdout; puts text into a queue."""
+logger = logging.getLogger(__name__)
 
-    def __init__(self, queue):
-        self.queue = queue
 
-    def write(self, text):
-        # tkinter expects str; ignore empty writes
-        if text:
-            self.queue.put(text)
+class LogSink(logging.Handler):
+    """
+    Logging handler that buffers formatted records for the output widget.
 
-    def flush(self):
-        pass  # required for some code that calls flush()
+    Worker threads only append to a bounded deque; the Tk thread drains it in
+    batches, so a burst of log lines costs one widget insert per tick instead
+    of one per write.  If the GUI falls behind, the oldest lines are dropped.
+    """
 
+    def __init__(self, max_pending=10000):
+        super().__init__()
+        self.pending = deque(maxlen=max_pending)
 
-def run_poolmap(result_holder, from_entry, to_entry, amt_entry, output_text, window):
+    def emit(self, record):
+        try:
+            self.pending.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def drain(self, max_records):
+        """Pop up to max_records buffered lines, joined for a single insert."""
+        lines = []
+        while self.pending and len(lines) < max_records:
+            lines.append(self.pending.popleft())
+        return "\n".join(lines)
+
+
+def run_poolmap(
+    result_holder, from_entry, to_entry, amt_entry, output_text, window, rpc, registry
+):
+    assets = registry.get("assets")
     from_token = from_entry.get().upper()
     to_token = to_entry.get().upper()
+    if assets is not None:
+        # resolve case-insensitively to the exact on-chain symbol
+        from_token = getattr(assets.find(from_token), "symbol", from_token)
+        to_token = getattr(assets.find(to_token), "symbol", to_token)
 
+    output_text.configure(state="normal")
     output_text.delete(1.0, tk.END)
-    output_text.insert(tk.END, f"Running analysis for {from_token} to {to_token}...\n")
+    output_text.configure(state="disabled")
+    logger.info(f"Running analysis for {from_token} to {to_token}...")
+
+    def analyse(**kwargs):
+        # a thread's exceptions go to stderr, log them so they reach the output
+        try:
+            pathfind(**kwargs)
+        except Exception:
+            logger.exception("Analysis failed")
 
     child = threading.Thread(
-        target=pathfind,
+        target=analyse,
         kwargs={
             "from_token": from_token,
             "to_token": to_token,
             "input_amount": float(amt_entry.get()),
             "result_holder": result_holder,
+            "rpc": rpc,
+            "prune": DEFAULT_PRUNE,
+            "assets": assets,
+            "route_cache": True,
         },
     )
     child.start()
 
-    def stream_output():
-        while child.is_alive():
-            window.update_idletasks()
-            window.update()
-            time.sleep(0.1)
-
-        output_text.insert(tk.END, "\nAnalysis complete.")
-
-    window.after(100, stream_output)
-
-
-def build_transaction(output_text, amt_entry, result, account_entry):
-    output_text.insert(tk.END, "\nBuilding transaction...\n")
-    _, asset_ids, pool_ids, balances, fees = result["result"]
-
-    input_amt = float(amt_entry.get())
-    original_input_amt = float(amt_entry.get())
-    account_id = account_entry.get()
-
-    rpc = result["rpc"]
-
-    edicts = []
-    for pool, pool_id, fee, ids in zip(balances, pool_ids, fees, itertools.pairwise(asset_ids)):
-        output_amt = wrapper(
-            rpc,
-            input_amt,
-            fee,
-            pool[0],
-            pool[1],
-            f"1.3.{pool[2]}",
-            f"1.3.{pool[3]}",
-            f"1.3.{ids[0]}",
-        )
-
-        edicts.append(
-            {
-                "amount_to_sell": input_amt,
-                "min_to_receive": output_amt,
-                "pool": pool_id,
-                "asset_id_to_sell": f"1.3.{ids[0]}",
-                "asset_id_to_receive": f"1.3.{ids[1]}",
-            }
-        )
-
-        input_amt = output_amt
-
-    asset_ids_to_fetch = []
-    for edict in edicts:
-        asset_ids_to_fetch.append(edict["asset_id_to_sell"])
-        asset_ids_to_fetch.append(edict["asset_id_to_receive"])
-
-    asset_details = rpc_get_objects(rpc, list(set(asset_ids_to_fetch)))
-    precisions = {asset["id"]: 10 ** asset["precision"] for asset in asset_details.values()}
-
-    operations = []
-    for edict in edicts:
-        operations.append(
-            [
-                63,
-                {
-                    "fee": {"amount": "100000", "asset_id": "1.3.0"},
-                    "account": account_id,
-                    "pool": edict["pool"],
-                    "amount_to_sell": {
-                        "amount": str(
-                            int(edict["amount_to_sell"] * precisions[edict["asset_id_to_sell"]])
-                        ),
-                        "asset_id": edict["asset_id_to_sell"],
-                    },
-                    "min_to_receive": {"amount": "1", "asset_id": edict["asset_id_to_receive"]},
-                    "extensions": [],
-                },
-            ]
-        )
-
-    expiration_time = (datetime.now(timezone.utc) + timedelta(hours=24)).strftime(
-        "%Y-%m-%dT%H:%M:%S"
+    def wait_for_analysis():
+        if child.is_alive():
+            window.after(100, wait_for_analysis)
+            return
+        logger.info("\nAnalysis complete.")
+
+    window.after(100, wait_for_analysis)
+
+
+def build_transaction(slippage_entry, result, account_entry):
+    logger.info("\nBuilding transaction...")
+    if "quote" not in result:
+        logger.info("Run an analysis first.")
+        return
+    hops = result["quote"]
+    if hops is None:
+        logger.info("Routes through order books need limit orders, not supported")
+        return
+
+    slippage = float(slippage_entry.get()) / 100
+    transactions = build_transactions(account_entry.get(), [hops], slippage)
+    names = save_transactions(transactions)
+
+    logger.info(json.dumps(hops, indent=2))
+    logger.info(f"final price: {hops[0]['amount_to_sell'] / hops[-1]['expected']}")
+    logger.info(f"Transaction saved to {', '.join(names)}")
+
+
+def show_impact_curve(window, amt_entry, result, threshold=0.01):
+    """Chart output shortfall against trade size for the last analysed route."""
+    if "result" not in result:
+        logger.info("\nRun an analysis first.")
+        return
+    _, token_path, pool_path, balances, _ = result["result"]
+    if any(pool is None for pool in balances):
+        logger.info("\nRoutes through order books cannot be swept")
+        return
+
+    try:
+        amount = float(amt_entry.get())
+    except ValueError:
+        amount = 0
+    if not amount > 0:
+        logger.info("\nEnter a positive amount to chart.")
+        return
+    curve = sweep_route(
+        token_path,
+        pool_path,
+        dict(zip(pool_path, balances)),
+        amount_grid(amount / 100, amount * 1000),
+        threshold,
+        result.get("assets"),
     )
-    transaction = {
-        "type": "api",
-        "id": f"{time.time()}-ehbxeor03-2",
-        "payload": {
-            "method": "injectedCall",
-            "params": [
-                "signAndBroadcast",
-                json.dumps(
-                    {
-                        "ref_block_num": 0,
-                        "ref_block_prefix": 0,
-                        "expiration": expiration_time,
-                        "operations": operations,
-                        "extensions": [],
-                        "signatures": [],
-                    }
-                ),
-                [],
-            ],
-            "appName": "Bitshares Astro UI",
-            "chain": "BTS",
-            "browser": "web browser",
-            "origin": "vaulta-exchange-haven.vercel.app",
-            "memo": False,
-        },
-    }
 
-    with open("transaction.json", "w") as f:
-        json.dump(transaction, f, indent=2)
+    width, height, pad = 640, 320, 40
+    top = tk.Toplevel(window)
+    top.title("Price Impact")
+    canvas = tk.Canvas(top, width=width, height=height, bg="#222222")
+    canvas.pack()
+
+    log_low = math.log10(curve["amounts"][0])
+    log_high = math.log10(curve["amounts"][-1])
+    top_impact = max(float(curve["impact"].max()), threshold) * 100
+
+    def xy(amt, impact):
+        x = pad + (math.log10(amt) - log_low) / (log_high - log_low) * (width - 2 * pad)
+        y = height - pad - impact * 100 / top_impact * (height - 2 * pad)
+        return x, y
+
+    canvas.create_line(pad, height - pad, width - pad, height - pad, fill="gray")
+    canvas.create_line(pad, pad, pad, height - pad, fill="gray")
+    canvas.create_text(pad, height - pad / 2, text=f"{curve['amounts'][0]:.4g}", fill="white")
+    canvas.create_text(
+        width - pad, height - pad / 2, text=f"{curve['amounts'][-1]:.4g}", fill="white"
+    )
+    canvas.create_text(pad, pad / 2, text=f"{top_impact:.3g}%", fill="white")
+    canvas.create_line(
+        *xy(curve["amounts"][0], threshold),
+        *xy(curve["amounts"][-1], threshold),
+        fill="orange",
+        dash=(4, 2),
+    )
+    points = [c for amt, imp in zip(curve["amounts"], curve["impact"]) for c in xy(amt, imp)]
+    canvas.create_line(*points, fill="lime", width=2)
 
-    print(json.dumps(edicts, indent=2))
-    print("final price:", original_input_amt / output_amt)
-    output_text.insert(tk.END, "Transaction saved to transaction.json\n")
+    if curve["threshold_size"] is not None:
+        logger.info(
+            f"Slippage reaches {threshold:.1%} at an input of {curve['threshold_size']:.6g}"
+        )
+    else:
+        logger.info(f"Slippage stays below {threshold:.1%} up to {curve['amounts'][-1]:.6g}")
 
 
-def main():
+def main(hedged=False):
     # Create the main window
     window = tk.Tk()
     window.title("BitShares Map Runner")
 
     result_holder = {}
-    rpc = wss_handshake()
+    # one connection shared by the GUI, analysis and transaction threads,
+    # or a hedged pool of them spreading requests over several nodes
+    rpc = HedgedRPC() if hedged else RPCMultiplexer()
+
+    # the asset registry is loaded once and shared by every analysis
+    registry = {}
+
+    def load_registry():
+        registry["assets"] = AssetRegistry(load_precisions())
+
+    threading.Thread(target=load_registry, daemon=True).start()
+
+    def suggest(event):
+        assets = registry.get("assets")
+        text = event.widget.get()
+        if assets is None or not text:
+            suggestion_label.config(text="")
+            return
+        matches = assets.prefix(text, limit=8)
+        suggestion_label.config(text="  ".join(asset.symbol for asset in matches))
 
     def get_account_id_from_name():
         account_name = account_name_entry.get().lower()
@@ -186,6 +222,8 @@ def main():
     to_entry = tk.Entry(window, width=30)
     to_entry.grid(column=1, row=1)
     to_entry.insert(0, "GBP")
+    from_entry.bind("<KeyRelease>", suggest)
+    to_entry.bind("<KeyRelease>", suggest)
 
     tk.Label(window, text="Amount:").grid(column=0, row=2)
     amt_entry = tk.Entry(window, width=30)
@@ -202,6 +240,11 @@ def main():
     account_entry.grid(column=1, row=4)
     account_entry.insert(0, "1.2.")
 
+    tk.Label(window, text="Slippage %:").grid(column=0, row=5)
+    slippage_entry = tk.Entry(window, width=30)
+    slippage_entry.grid(column=1, row=5)
+    slippage_entry.insert(0, "0.5")
+
     get_id_button = tk.Button(
         window,
         text="Get Account ID",
@@ -213,7 +256,7 @@ def main():
         window,
         text="Run Analysis",
         command=lambda: run_poolmap(
-            result_holder, from_entry, to_entry, amt_entry, output_text, window
+            result_holder, from_entry, to_entry, amt_entry, output_text, window, rpc, registry
         ),
     )
     run_button.grid(column=2, row=2, rowspan=2, padx=10)
@@ -221,38 +264,50 @@ def main():
     save_button = tk.Button(
         window,
         text="Save Transaction",
-        command=lambda: build_transaction(output_text, amt_entry, result_holder, account_entry),
+        command=lambda: build_transaction(slippage_entry, result_holder, account_entry),
     )
     save_button.grid(column=2, row=4, rowspan=2, padx=10)
 
+    impact_button = tk.Button(
+        window,
+        text="Price Impact",
+        command=lambda: show_impact_curve(window, amt_entry, result_holder),
+    )
+    impact_button.grid(column=3, row=2, rowspan=2, padx=10)
+
+    suggestion_label = tk.Label(window, text="", anchor="w")
+    suggestion_label.grid(column=0, row=6, columnspan=4, sticky="w")
+
     output_text = scrolledtext.ScrolledText(window, width=100, height=30)
-    output_text.grid(column=0, row=6, columnspan=3, pady=10)
+    output_text.grid(column=0, row=7, columnspan=4, pady=10)
+
+    def gui_updater(window, text_widget, sink, batch=500, max_lines=5000):
+        """Move one batch of buffered log lines into the widget, then trim its history."""
+        text = sink.drain(batch)
+        if text:
+            text_widget.configure(state="normal")
+            if text_widget.compare("end-1c", "!=", "1.0"):
+                text = "\n" + text
+            text_widget.insert(tk.END, text)
+            lines = int(text_widget.index("end-1c").split(".")[0])
+            if lines > max_lines:
+                text_widget.delete("1.0", f"{lines - max_lines + 1}.0")
+            text_widget.see(tk.END)
+            text_widget.configure(state="disabled")
+        # come back sooner while a backlog remains
+        window.after(10 if sink.pending else 100, gui_updater, window, text_widget, sink)
+
+    # every module logs through the root logger; the sink batches it into the widget
+    sink = LogSink()
+    sink.setFormatter(logging.Formatter("%(message)s"))
+    root_logger = logging.getLogger()
+    root_logger.addHandler(sink)
+    root_logger.setLevel(logging.INFO)
+    window.after(100, gui_updater, window, output_text, sink)
 
-    def gui_updater(window, text_widget, queue):
-        """Transfer queued text into the ScrolledText widget periodically."""
-        try:
-            while True:
-                s = queue.get_nowait()
-                text_widget.configure(state="normal")
-                text_widget.insert(tk.END, s)
-                text_widget.see(tk.END)
-                text_widget.configure(state="disabled")
-        except:
-            pass
-        window.after(100, gui_updater, window, text_widget, queue)
-
-    q = queue.Queue()
-    old_stdout = sys.stdout
-    old_stderr = sys.stderr
-    sys.stdout = StdoutRedirector(q)  # redirect stdout
-    sys.stderr = StdoutRedirector(q)  # redirect stderr
-    # Start GUI updater loop
-    window.after(100, gui_updater, window, output_text, q)
-
-    # Restore stdout on close
     def on_close():
-        sys.stdout = old_stdout
-        sys.stderr = old_stderr
+        root_logger.removeHandler(sink)
+        rpc.close()
         window.destroy()
 
     window.protocol("WM_DELETE_WINDOW", on_close)
@@ -261,4 +316,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(hedged="--hedged" in sys.argv)
@@ -0,0 +1,203 @@
+"""
+Append-only, memory-mapped history of pool balances for backtesting.
+
+Every refresh of balance_data is appended as rows to one flat NumPy file per
+column (pool index, balances and fees) plus a row in a snapshot index holding
+its timestamp and row span.  Reads memory-map the files, so any time range is
+served as zero-copy views no matter how many months are on disk.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from poolmap import bootstrap_prices_from_core, build_graph
+
+COLUMNS = {
+    "pool": np.int32,
+    "bal_a": np.float64,
+    "bal_b": np.float64,
+    "fee": np.float64,
+    "withdrawal_fee": np.float64,
+}
+
+SNAPSHOT = np.dtype([("time", np.float64), ("start", np.int64), ("stop", np.int64)])
+
+
+class PoolHistory:
+    """
+    Columnar pool balance history stored under one directory
+    """
+
+    def __init__(self, path="pool_history", min_interval=0):
+        self.path = path
+        self.min_interval = min_interval
+        os.makedirs(path, exist_ok=True)
+        self.pools_file = os.path.join(path, "pools.json")
+        if os.path.exists(self.pools_file):
+            with open(self.pools_file) as f:
+                self.pools = [tuple(pool) for pool in json.load(f)]
+        else:
+            self.pools = []
+        self.pool_index = {pool_id: idx for idx, (pool_id, _, _) in enumerate(self.pools)}
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _map(self, name, dtype):
+        """
+        Read only memory map of a column, empty if nothing is recorded yet
+        """
+        filename = self._file(name)
+        if not os.path.exists(filename) or not os.path.getsize(filename):
+            return np.empty(0, dtype)
+        return np.memmap(filename, dtype, mode="r")
+
+    def snapshots(self):
+        """
+        The snapshot index: one (time, start, stop) row per recorded refresh
+        """
+        return self._map("snapshots", SNAPSHOT)
+
+    def _write_pools(self):
+        with open(self.pools_file, "w") as f:
+            json.dump(self.pools, f)
+
+    def _truncate(self, stop):
+        """
+        Cut every column back to stop rows, and the pool list back to the pools
+        those rows reference
+        """
+        truncated = False
+        for name, dtype in COLUMNS.items():
+            filename = self._file(name)
+            size = stop * np.dtype(dtype).itemsize
+            if os.path.exists(filename) and os.path.getsize(filename) > size:
+                os.truncate(filename, size)
+                truncated = True
+        if not truncated:
+            # pools are only written once their rows are, so nothing can be stale
+            return
+        column = self._map("pool", COLUMNS["pool"])
+        referenced = int(column.max()) + 1 if len(column) else 0
+        if len(self.pools) > referenced:
+            del self.pools[referenced:]
+            self.pool_index = {pool_id: idx for idx, (pool_id, _, _) in enumerate(self.pools)}
+            self._write_pools()
+
+    def record(self, balance_data, timestamp=None):
+        """
+        Append one refresh of balance_data; returns False if within min_interval
+        of the previous snapshot
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        # a torn index row is dropped along with the rows it would have covered
+        filename = self._file("snapshots")
+        if os.path.exists(filename):
+            size = os.path.getsize(filename)
+            if size % SNAPSHOT.itemsize:
+                os.truncate(filename, size - size % SNAPSHOT.itemsize)
+        snapshots = self.snapshots()
+        if len(snapshots) and timestamp - snapshots["time"][-1] < self.min_interval:
+            return False
+
+        # roll back whatever a crash left past the last complete snapshot first
+        stop = int(snapshots["stop"][-1]) if len(snapshots) else 0
+        self._truncate(stop)
+
+        new_pools = [pool_id for pool_id in balance_data if pool_id not in self.pool_index]
+        for pool_id in new_pools:
+            self.pool_index[pool_id] = len(self.pools)
+            self.pools.append((pool_id, balance_data[pool_id][2], balance_data[pool_id][3]))
+
+        pools = list(balance_data.values())
+        rows = {
+            "pool": [self.pool_index[pool_id] for pool_id in balance_data],
+            "bal_a": [pool[0] for pool in pools],
+            "bal_b": [pool[1] for pool in pools],
+            "fee": [pool[4] for pool in pools],
+            "withdrawal_fee": [pool[5] for pool in pools],
+        }
+        for name, dtype in COLUMNS.items():
+            with open(self._file(name), "ab") as f:
+                f.write(np.asarray(rows[name], dtype).tobytes())
+        if new_pools:
+            self._write_pools()
+        # the index row goes last: until it lands the appended rows are not part
+        # of any snapshot, and the next record truncates them away
+        with open(self._file("snapshots"), "ab") as f:
+            f.write(np.array([(timestamp, stop, stop + len(pools))], SNAPSHOT).tobytes())
+        return True
+
+    def range(self, start=None, end=None):
+        """
+        Zero-copy column views of every snapshot with start <= time <= end
+        ~
+        returns (snapshot index slice, {column: view}); the index rows keep their
+        absolute start and stop offsets, so subtract the first start to slice views
+        """
+        snapshots = self.snapshots()
+        first = 0 if start is None else np.searchsorted(snapshots["time"], start, "left")
+        last = len(snapshots) if end is None else np.searchsorted(snapshots["time"], end, "right")
+        snapshots = snapshots[first:last]
+        if not len(snapshots):
+            return snapshots, {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        rows = slice(int(snapshots["start"][0]), int(snapshots["stop"][-1]))
+        return snapshots, {name: self._map(name, dtype)[rows] for name, dtype in COLUMNS.items()}
+
+    def balance_data(self, snapshot):
+        """
+        Rebuild a balance_data dict from one row of the snapshot index
+        """
+        rows = slice(int(snapshot["start"]), int(snapshot["stop"]))
+        columns = {name: self._map(name, dtype)[rows] for name, dtype in COLUMNS.items()}
+        return {
+            self.pools[idx][0]: (
+                float(bal_a),
+                float(bal_b),
+                self.pools[idx][1],
+                self.pools[idx][2],
+                float(fee),
+                float(withdrawal_fee),
+            )
+            for idx, bal_a, bal_b, fee, withdrawal_fee in zip(
+                columns["pool"].tolist(),
+                columns["bal_a"],
+                columns["bal_b"],
+                columns["fee"],
+                columns["withdrawal_fee"],
+            )
+        }
+
+    def at(self, timestamp):
+        """
+        balance_data as of the last snapshot at or before timestamp
+        """
+        snapshots = self.snapshots()
+        idx = np.searchsorted(snapshots["time"], timestamp, "right") - 1
+        if idx < 0:
+            return None
+        return self.balance_data(snapshots[idx])
+
+    def iter_balance_data(self, start=None, end=None):
+        """
+        Yield (time, balance_data) for every snapshot in a time range
+        """
+        snapshots, _ = self.range(start, end)
+        for snapshot in snapshots:
+            yield float(snapshot["time"]), self.balance_data(snapshot)
+
+
+def replay_prices(rpc, history, input_amount, core, start=None, end=None, target=None):
+    """
+    Re-run the two pass pricing of generate_all_prices against every historical
+    snapshot in a range, yielding (time, (prices, token_paths, pool_paths))
+    """
+    for timestamp, balance_data in history.iter_balance_data(start, end):
+        graph = build_graph(balance_data)
+        cer_prices, _, _ = bootstrap_prices_from_core(rpc, 1, graph, base_token=0)
+        yield timestamp, bootstrap_prices_from_core(
+            rpc, input_amount, graph, core, cer_prices=cer_prices, target=target
+        )
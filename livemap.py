@@ -0,0 +1,304 @@
+"""
+Live pool map pushed to the browser as incremental updates.
+
+Instead of writing a fresh liquidity_pool_map.html on every plot, LiveMap
+serves one page from a small local server and streams node and edge deltas
+(balances, route highlights, new or vanished pools) to it over server-sent
+events.  The page applies them to its vis.js data sets in place, so the layout
+settles once and keeps its positions while the network changes underneath.
+
+    python livemap.py --pair XBTSX.USDT HONEST.MONEY --port 8765
+
+or push the result of any analysis to an open map:
+
+    live = LiveMap().start()
+    poolmap.main(live=live)
+"""
+
+# STANDARD PYTHON MODULES
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps as json_dumps
+
+# THIRD PARTY MODULES
+import pyvis
+
+# BITSHARES NETWORK MODULES
+from poolmap import PLOT_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+VIS_SCRIPT = os.path.join(os.path.dirname(pyvis.__file__), "lib", "vis-9.1.2", "vis-network.min.js")
+VIS_CDN = "https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js"
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Liquidity Pool Map</title>
+<script src="/vis-network.min.js"></script>
+<style>
+body { margin: 0; background: #222222; }
+#map { width: 100%; height: 100vh; }
+</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+OPTIONS
+var nodes = new vis.DataSet();
+var edges = new vis.DataSet();
+new vis.Network(document.getElementById("map"), {nodes: nodes, edges: edges}, options);
+
+// upserts and removals only, so nodes that stay keep their positions
+function apply(set, change) {
+  if (change.remove.length) { set.remove(change.remove); }
+  if (change.update.length) { set.update(change.update); }
+}
+function sync(set, items) {
+  var ids = new Set(items.map(function (item) { return item.id; }));
+  set.remove(set.getIds().filter(function (id) { return !ids.has(id); }));
+  set.update(items);
+}
+// the server opens every stream, including reconnects, with a full snapshot
+new EventSource("/events").onmessage = function (event) {
+  var message = JSON.parse(event.data);
+  if (message.type === "snapshot") {
+    sync(nodes, message.nodes);
+    sync(edges, message.edges);
+  } else {
+    apply(nodes, message.nodes);
+    apply(edges, message.edges);
+  }
+};
+</script>
+</body>
+</html>
+"""
+
+
+def map_elements(balance_data, assets, routes=()):
+    """
+    vis.js nodes and edges for the pools in balance_data, keyed by id
+    ~
+    routes is an iterable of (token_path, pool_path) to highlight, styled as
+    the html plot styles its route; edges are keyed by pool id so parallel
+    pools between the same assets stay separate
+    """
+    route_assets = {asset for token_path, _ in routes for asset in token_path}
+    route_pools = {pool_id for _, pool_path in routes for pool_id in pool_path}
+
+    nodes = {}
+    edges = {}
+    for pool_id, (bal_a, bal_b, asset_a, asset_b, fee, _) in balance_data.items():
+        if not (bal_a and bal_b):
+            continue
+        for asset in (asset_a, asset_b):
+            if asset not in nodes:
+                nodes[asset] = {
+                    "id": asset,
+                    "label": assets.symbol(asset),
+                    "color": "skyblue" if asset in route_assets else "#97c2fc",
+                }
+        on_route = pool_id in route_pools
+        edges[pool_id] = {
+            "id": pool_id,
+            "from": asset_a,
+            "to": asset_b,
+            "title": (
+                f"{pool_id}: {bal_a:.6g} {assets.symbol(asset_a)}"
+                f" / {bal_b:.6g} {assets.symbol(asset_b)}, fee {fee}%"
+            ),
+            "color": "lime" if on_route else "gray",
+            "width": 2.0 if on_route else 1.0,
+        }
+    return nodes, edges
+
+
+def diff(old, new):
+    """
+    The upserts and removals that turn one id keyed element dict into another
+    """
+    return {
+        "update": [item for key, item in new.items() if old.get(key) != item],
+        "remove": [key for key in old if key not in new],
+    }
+
+
+class LiveMapHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        live = self.server.live
+        if self.path == "/":
+            self._send(PAGE.replace("OPTIONS", PLOT_OPTIONS).encode(), "text/html")
+        elif self.path == "/vis-network.min.js":
+            if not os.path.exists(VIS_SCRIPT):
+                self.send_response(302)
+                self.send_header("Location", VIS_CDN)
+                self.end_headers()
+                return
+            with open(VIS_SCRIPT, "rb") as f:
+                self._send(f.read(), "application/javascript")
+        elif self.path == "/events":
+            self._stream(live)
+        else:
+            self.send_error(404)
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, live):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        client = live.subscribe()
+        try:
+            while not live.closed:
+                try:
+                    message = client.get(timeout=15)
+                except queue.Empty:
+                    # a comment line keeps proxies and the browser from timing out
+                    self.wfile.write(b": keepalive\n\n")
+                else:
+                    self.wfile.write(f"data: {message}\n\n".encode())
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            live.unsubscribe(client)
+
+    def log_message(self, *args):
+        pass
+
+
+class LiveMap:
+    """
+    Local server streaming pool map deltas to every open page
+    ~
+    each client gets a bounded queue; one that falls max_pending messages
+    behind has its backlog replaced by a single fresh snapshot
+    """
+
+    def __init__(self, port=8765, max_pending=100):
+        self.max_pending = max_pending
+        self.nodes = {}
+        self.edges = {}
+        self.clients = []
+        self.lock = threading.Lock()
+        self.closed = False
+        ThreadingHTTPServer.allow_reuse_address = True
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), LiveMapHandler)
+        self.server.daemon_threads = True
+        self.server.live = self
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Live map at {self.url}")
+        return self
+
+    def stop(self):
+        self.closed = True
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _snapshot(self):
+        return json_dumps(
+            {
+                "type": "snapshot",
+                "nodes": list(self.nodes.values()),
+                "edges": list(self.edges.values()),
+            }
+        )
+
+    def _push(self, client, message):
+        try:
+            client.put_nowait(message)
+        except queue.Full:
+            with client.mutex:
+                client.queue.clear()
+            client.put_nowait(self._snapshot())
+
+    def subscribe(self):
+        client = queue.Queue(self.max_pending)
+        with self.lock:
+            client.put_nowait(self._snapshot())
+            self.clients.append(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def update(self, balance_data, assets, routes=()):
+        """
+        Push the changes since the last update to every open page; returns the
+        number of changed nodes and edges
+        """
+        nodes, edges = map_elements(balance_data, assets, routes)
+        with self.lock:
+            delta = {
+                "type": "delta",
+                "nodes": diff(self.nodes, nodes),
+                "edges": diff(self.edges, edges),
+            }
+            self.nodes, self.edges = nodes, edges
+            changes = sum(
+                len(change) for kind in ("nodes", "edges") for change in delta[kind].values()
+            )
+            if changes:
+                message = json_dumps(delta)
+                for client in self.clients:
+                    self._push(client, message)
+        return changes
+
+
+def main():
+    # imported here so LiveMap can be used without the scheduler's dependencies
+    from watchlist import WatchlistScheduler
+
+    parser = argparse.ArgumentParser(description="Serve a live updating pool map.")
+    parser.add_argument(
+        "--pair",
+        nargs=2,
+        action="append",
+        metavar=("FROM", "TO"),
+        help="A pair whose route is highlighted, may be repeated.",
+    )
+    parser.add_argument("--amount", type=float, default=1)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--interval", type=float, default=3)
+    parser.add_argument("--mock", action="store_true", help="Use mock data instead of live data.")
+    args = parser.parse_args()
+
+    pairs = args.pair or [("XBTSX.USDT", "HONEST.MONEY")]
+    scheduler = WatchlistScheduler(
+        [(from_token, to_token, args.amount) for from_token, to_token in pairs], mock=args.mock
+    )
+    live = LiveMap(args.port).start()
+    try:
+        while True:
+            started = time.time()
+            scheduler.run_cycle()
+            routes = [
+                (route["token_path"], route["pool_path"]) for route in scheduler.routes.values()
+            ]
+            live.update(scheduler.balance_data, scheduler.assets, routes)
+            time.sleep(max(0, args.interval - (time.time() - started)))
+    except KeyboardInterrupt:
+        live.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    main()
@@ -7,13 +7,23 @@ Credits go to Bitshares-UI devs and Grok.com for making this possible.
 import math
 from decimal import ROUND_CEILING, ROUND_FLOOR, Decimal, getcontext
 
+import numpy as np
+
 from rpc import rpc_get_objects
 
 getcontext().prec = 28
 
 
-def calculate_min_to_receive(amount_to_sell_str, pool, sell_tag, receive_tag):
-    amount_to_sell = Decimal(amount_to_sell_str)
+def calculate_exchange(amount_to_sell_str, pool, sell_tag, receive_tag):
+    """
+    Full satoshi breakdown of a pool exchange
+    ~
+    returns the amount received along with how far each pool balance moves:
+    the pool takes the sold amount less the seller's market fee, and pays out
+    the swap delta less the pool fee it keeps
+    """
+    # str() first, a float converted straight to Decimal carries its binary error
+    amount_to_sell = Decimal(str(amount_to_sell_str))
 
     asset_a = pool[f"asset_{sell_tag}"]
     asset_b = pool[f"asset_{receive_tag}"]
@@ -35,15 +45,16 @@ def calculate_min_to_receive(amount_to_sell_str, pool, sell_tag, receive_tag):
     max_market_fee_a = Decimal(asset_a["options"]["max_market_fee"])
     max_market_fee_b = Decimal(asset_b["options"]["max_market_fee"])
 
+    # the chain sells whole satoshis and takes its market fee from them
+    amount_to_sell_sat = (amount_to_sell * pool_amount_ap).quantize(Decimal("1"))
+
     def flags_a():
         if asset_a_flags % 2 == 0:
             return Decimal(0)
         if maker_market_fee_percent_a == 0:
             return Decimal(0)
         if maker_market_fee_percent_a > 0:
-            calculated = (
-                amount_to_sell * pool_amount_ap * (maker_market_fee_percent_a / Decimal(10000))
-            )
+            calculated = amount_to_sell_sat * (maker_market_fee_percent_a / Decimal(10000))
             ceiled = calculated.quantize(Decimal("1"), rounding=ROUND_CEILING)
             return min(max_market_fee_a, ceiled)
 
@@ -92,7 +103,7 @@ def calculate_min_to_receive(amount_to_sell_str, pool, sell_tag, receive_tag):
     ).quantize(Decimal("1"), rounding=ROUND_CEILING)
     tmp_delta_b = pool_amount_b - (
         (pool_amount_b * pool_amount_a)
-        / (pool_amount_a + (amount_to_sell * pool_amount_ap - flags_a_val))
+        / (pool_amount_a + (amount_to_sell_sat - flags_a_val))
     ).quantize(Decimal("1"), rounding=ROUND_CEILING)
 
     pool_taker_fee_percent = Decimal(pool["taker_fee_percent"])
@@ -117,7 +128,60 @@ def calculate_min_to_receive(amount_to_sell_str, pool, sell_tag, receive_tag):
     min_receive_sat = tmp_delta_b - pool_fee_floor - asset_fee_ceil
     min_to_receive = min_receive_sat / pool_amount_bp
 
-    return min_to_receive
+    return {
+        "min_to_receive": min_to_receive,
+        "min_receive_sat": min_receive_sat,
+        "balance_sell_delta": amount_to_sell_sat - flags_a_val,
+        "balance_receive_delta": -(tmp_delta_b - pool_fee_floor),
+    }
+
+
+def calculate_min_to_receive(amount_to_sell_str, pool, sell_tag, receive_tag):
+    return calculate_exchange(amount_to_sell_str, pool, sell_tag, receive_tag)["min_to_receive"]
+
+
+def calculate_min_to_receive_batch(
+    amounts_to_sell, balance_sell, balance_receive, asset_sell, asset_receive, pool_fee_percent
+):
+    """
+    Vectorized calculate_min_to_receive for many sell amounts on one pool
+    ~
+    same satoshi rounding and fee steps as the Decimal version, in float64, so
+    a whole grid of amounts is quoted in one pass; balances are in satoshis and
+    pool_fee_percent is the pool's raw taker_fee_percent (100 == 1%)
+    """
+    amounts = np.asarray(amounts_to_sell, dtype=float)
+    sell_options = asset_sell["options"]
+    receive_options = asset_receive["options"]
+    sell_p = 10.0 ** int(asset_sell["precision"])
+    receive_p = 10.0 ** int(asset_receive["precision"])
+
+    amounts_sat = np.round(amounts * sell_p)
+    market_fee_sell = np.zeros_like(amounts_sat)
+    maker_percent_sell = float(sell_options["market_fee_percent"])
+    if int(sell_options["flags"]) % 2 and maker_percent_sell > 0:
+        market_fee_sell = np.minimum(
+            float(sell_options["max_market_fee"]),
+            np.ceil(amounts_sat * maker_percent_sell / 10000),
+        )
+
+    delta_receive = balance_receive - np.ceil(
+        balance_receive * balance_sell / (balance_sell + (amounts_sat - market_fee_sell))
+    )
+
+    taker_receive = 0.0
+    if int(receive_options["flags"]) % 2:
+        taker = receive_options.get("extensions", {}).get("taker_fee_percent")
+        if taker is None:
+            taker = receive_options["market_fee_percent"]
+        taker_receive = float(taker) / 10000
+
+    pool_fee = np.floor(delta_receive * float(pool_fee_percent) / 10000)
+    asset_fee = np.minimum(
+        float(receive_options["max_market_fee"]), np.ceil(delta_receive * taker_receive)
+    )
+
+    return np.maximum(0, delta_receive - pool_fee - asset_fee) / receive_p
 
 
 # Usage example:
@@ -156,21 +220,29 @@ def calculate_min_to_receive(amount_to_sell_str, pool, sell_tag, receive_tag):
 # print(result)
 
 
+def quote_exchange(amount, fee, balance_sell, balance_receive, asset_sell, asset_receive):
+    """
+    min_to_receive from human balances and the two asset objects directly,
+    for callers that already hold the objects and want no id lookups
+    """
+    pool = {
+        # rounded, not truncated: float noise must not shave a satoshi or a
+        # basis point, and every engine converts the same way
+        "balance_sell": round(balance_sell * 10 ** int(asset_sell["precision"])),
+        "balance_receive": round(balance_receive * 10 ** int(asset_receive["precision"])),
+        "asset_sell": asset_sell,
+        "asset_receive": asset_receive,
+        "taker_fee_percent": round(fee * 100),
+    }
+    return float(calculate_min_to_receive(amount, pool, "sell", "receive"))
+
+
 def wrapper(rpc, amount_a, fee, balance_a, balance_b, a_id, b_id, direction):
     """
     FIXME ideally this conversion layer isn't needed,
     we're re-precisioning to de-precision, not ideal.
     """
     objects = rpc_get_objects(rpc, [a_id, b_id])
-    pool = {
-        f"balance_{a_id}": int(balance_a * (10 ** objects[a_id]["precision"])),
-        f"balance_{b_id}": int(balance_b * (10 ** objects[b_id]["precision"])),
-        f"asset_{a_id}": objects[a_id],
-        f"asset_{b_id}": objects[b_id],
-        "taker_fee_percent": int(fee * 100),
-    }
-    # import json
-    # print(json.dumps(pool, indent=2))
-    return float(
-        calculate_min_to_receive(amount_a, pool, direction, a_id if direction == b_id else b_id)
-    )
+    if direction == a_id:
+        return quote_exchange(amount_a, fee, balance_a, balance_b, objects[a_id], objects[b_id])
+    return quote_exchange(amount_a, fee, balance_b, balance_a, objects[b_id], objects[a_id])
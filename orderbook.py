@@ -0,0 +1,172 @@
+"""
+Order book edges for hybrid routing.
+
+The DEX limit order books often hold more depth than the liquidity pools, so
+each relevant market's book is fetched (in pipelined batches, cached per block)
+and added to the routing graph as an extra edge next to the pool edges.
+"""
+
+import logging
+
+from assets import AssetRegistry
+from rpc import rpc_get_objects, rpc_order_books, wss_query
+
+logger = logging.getLogger(__name__)
+
+
+class OrderBookCache:
+    """
+    Order books keyed by market, refetched in one batch once the head block moves
+    """
+
+    def __init__(self, limit=50):
+        self.limit = limit
+        self.books = {}
+
+    def get(self, rpc, markets):
+        """
+        Return the books for the given (base, quote) markets, batching any misses
+        """
+        head = wss_query(rpc, ["database", "get_dynamic_global_properties", []])
+        head = head["head_block_number"]
+        stale = [
+            market
+            for market in markets
+            if market not in self.books or self.books[market][0] != head
+        ]
+        if stale:
+            logger.info(f"Requesting {len(stale)} order books...")
+            for market, book in rpc_order_books(rpc, stale, self.limit).items():
+                self.books[market] = (head, book)
+        return {market: self.books[market][1] for market in markets if market in self.books}
+
+
+BOOKS = OrderBookCache()
+
+
+def taker_fee_percent(asset):
+    """
+    Market fee in percent charged to a taker receiving this asset
+    """
+    options = asset["options"]
+    if int(options["flags"]) % 2 == 0:
+        return 0
+    taker = options.get("extensions", {}).get("taker_fee_percent")
+    if taker is None:
+        taker = options["market_fee_percent"]
+    return int(taker) / 100
+
+
+def book_levels(book):
+    """
+    Split one get_order_book(base, quote) result into sell levels for each side
+    ~
+    returns (quote_levels, base_levels); each level is (rate, capacity) where rate
+    is units received per unit sold and capacity is the most that can be sold there
+    """
+    # selling quote fills the bids, which pay base per quote
+    quote_levels = [(float(bid["price"]), float(bid["quote"])) for bid in book.get("bids", [])]
+    # selling base fills the asks, which pay quote per base
+    base_levels = [
+        (1 / float(ask["price"]), float(ask["base"]))
+        for ask in book.get("asks", [])
+        if float(ask["price"])
+    ]
+    return quote_levels, base_levels
+
+
+def add_book_edges(G, books, assets=None):
+    """
+    Add one edge per non-empty order book beside the pool edges of the graph
+    ~
+    :param books: {(base, quote): book} with 1.3.x ids, as from OrderBookCache.get
+    :param assets: AssetRegistry holding the objects for fees, defaults to one
+        built from the rpc_get_objects cache
+    """
+    if assets is None:
+        assets = AssetRegistry(getattr(rpc_get_objects, "cache", {}))
+    for (base, quote), book in books.items():
+        quote_levels, base_levels = book_levels(book)
+        if not quote_levels and not base_levels:
+            continue
+        base_id = int(base.rsplit(".", 1)[1])
+        quote_id = int(quote.rsplit(".", 1)[1])
+        fees = {}
+        for instance in (base_id, quote_id):
+            asset = assets.by_instance.get(instance)
+            has_object = asset is not None and asset.object is not None
+            fees[instance] = taker_fee_percent(asset.object) if has_object else 0
+        G.add_edge(
+            base_id,
+            quote_id,
+            pool=f"book:{base}:{quote}",
+            book=True,
+            bal_a=sum(capacity for _, capacity in base_levels),
+            bal_b=sum(capacity for _, capacity in quote_levels),
+            asset_a=base_id,
+            asset_b=quote_id,
+            levels={base_id: base_levels, quote_id: quote_levels},
+            fees=fees,
+            fee=0,
+        )
+    return G
+
+
+def book_markets(G):
+    """
+    The (base, quote) markets that share an asset pair with a pool edge
+    """
+    markets = set()
+    for _, _, data in G.edges(data=True):
+        if data.get("book"):
+            continue
+        pair = sorted((data["asset_a"], data["asset_b"]))
+        markets.add((f"1.3.{pair[0]}", f"1.3.{pair[1]}"))
+    return sorted(markets)
+
+
+def fill_levels(levels, amount):
+    """
+    Walk sell levels best first; return (amount received, marginal rate) or None
+    if the book is too thin to absorb the whole amount
+    """
+    received = 0
+    remaining = amount
+    for rate, capacity in levels:
+        take = min(remaining, capacity)
+        received += take * rate
+        remaining -= take
+        if remaining <= 0:
+            return received, rate
+    return None
+
+
+def get_book_slippage(amount, data, sell_asset, cer_prices):
+    """
+    Quote an order book edge in the same terms get_slippage quotes a pool edge
+    ~
+    the marginal rate after the fill plays the part of the pool's post trade
+    price, so pool and book edges compare directly in the route search;
+    returns None when the book cannot fill the amount
+    """
+    receive_asset = data["asset_b"] if sell_asset == data["asset_a"] else data["asset_a"]
+    levels = data["levels"][sell_asset]
+    fill = fill_levels(levels, amount) if levels and amount > 0 else None
+    if fill is None:
+        return None
+
+    received, marginal_rate = fill
+    fee = data["fees"][receive_asset] / 100
+    actual_out = received * (1 - fee)
+
+    cer = cer_prices[receive_asset] if cer_prices else None
+    effective_out = max(0, actual_out - ((1 / cer) if cer_prices else 0))
+    if not effective_out:
+        return None
+
+    # rates are receive per sell, prices are sell per receive
+    instant_price = 1 / levels[0][0]
+    actual_price = (1 / marginal_rate) * (received / actual_out)
+    effective_price = (1 / marginal_rate) * (received / effective_out)
+
+    return instant_price / effective_price, actual_price
@@ -2,6 +2,7 @@ import argparse
 import heapq
 import itertools
 import json
+import logging
 import math
 import ssl
 from collections import defaultdict
@@ -11,13 +12,80 @@ import numpy as np
 import requests
 from pyvis.network import Network
 
-from min_to_receive import wrapper
-from rpc import rpc_get_objects, wss_handshake
+from assets import AssetRegistry
+from feeds import FEEDS, feed_premiums, oracle_prices
+from min_to_receive import quote_exchange, wrapper
+from orderbook import BOOKS, add_book_edges, book_markets, get_book_slippage, taker_fee_percent
+from report import liquidity_report, write_report
+from routecache import ROUTES
+from rpc import HedgedRPC, get_liquidity_pool_volume, rpc_get_objects, wss_handshake
 
+logger = logging.getLogger(__name__)
 
-def constant_product_output(dx, x_reserve, y_reserve):
-    """Uniswap-style formula"""
-    return (y_reserve / x_reserve) * dx
+
+# (min_tvl, min_volume) in core terms for everyday routing, see prune_pools
+DEFAULT_PRUNE = (1000, 0)
+
+# vis.js options shared by the html plot and the live map
+PLOT_OPTIONS = """
+    var options = {
+      "nodes": {
+        "font": {
+          "size": 12
+        }
+      },
+      "edges": {
+        "color": {
+          "inherit": true
+        },
+        "smooth": {
+          "type": "continuous"
+        }
+      },
+      "physics": {
+        "forceAtlas2Based": {
+          "gravitationalConstant": -50,
+          "centralGravity": 0.01,
+          "springLength": 230,
+          "springConstant": 0.08,
+          "damping": 0.4,
+          "avoidOverlap": 0
+        },
+        "minVelocity": 0.75,
+        "solver": "forceAtlas2Based"
+      }
+    }
+    """
+
+
+def constant_product_output(dx, x_reserve, y_reserve, fee=0):
+    """Uniswap-style formula, less a fee in percent of the output"""
+    return y_reserve * dx / (x_reserve + dx) * (1 - fee / 100)
+
+
+def output_lower_bound(amount, fee, balance_sell, balance_receive, sell, receive):
+    """
+    Float floor under quote_exchange for the same arguments, in receive units
+    ~
+    the constant product output with every fee charged at its full rate, less
+    the satoshis the exact engine can lose to rounded balances and fees;
+    None when the trade is too small for the bound to say anything
+    """
+    sell_unit = 10.0 ** -int(sell["precision"])
+    receive_unit = 10.0 ** -int(receive["precision"])
+    options = sell["options"]
+    maker_fee = int(options["market_fee_percent"]) / 10000 if int(options["flags"]) % 2 else 0
+    # up to half a unit lost rounding the amount to satoshis, one to the fee ceiling
+    net = amount * (1 - maker_fee) - 2 * sell_unit
+    if net <= 0:
+        return None
+    out = constant_product_output(
+        net,
+        balance_sell + sell_unit,
+        balance_receive - receive_unit,
+        fee + taker_fee_percent(receive),
+    )
+    return out * (1 - 1e-9) - 2 * receive_unit
 
 
 def build_graph(pools):
@@ -40,41 +108,175 @@ def build_graph(pools):
     return G
 
 
-def get_slippage(rpc, amount, fee, balance_a, balance_b, a_id, b_id, from_asset, cer_prices):
+def pool_liquidity(balance_data, prices, volumes=None, assets=None):
+    """
+    Value locked and 24h volume of each pool in core terms
+    ~
+    prices are units of each asset per core, as from bootstrap_prices_from_core;
+    pools with an asset the prices cannot value come back as None
+    """
+    liquidity = {}
+    for pool_id, (bal_a, bal_b, asset_a, asset_b, _, _) in balance_data.items():
+        if asset_a not in prices or asset_b not in prices:
+            liquidity[pool_id] = None
+            continue
+        tvl = bal_a / prices[asset_a] + bal_b / prices[asset_b]
+        volume = None
+        if volumes is not None and assets is not None and pool_id in volumes:
+            volume = volumes[pool_id] / assets.by_instance[asset_a].scale / prices[asset_a]
+        liquidity[pool_id] = (tvl, volume)
+    return liquidity
+
+
+def prune_pools(balance_data, liquidity, min_tvl=0, min_volume=0):
+    """
+    The pools worth routing through: at least min_tvl locked and min_volume
+    traded in 24h, both in core terms; pools that cannot be valued are kept
+    """
+    return {
+        pool_id: pool
+        for pool_id, pool in balance_data.items()
+        if liquidity.get(pool_id) is None
+        or (
+            liquidity[pool_id][0] >= min_tvl
+            and (liquidity[pool_id][1] is None or liquidity[pool_id][1] >= min_volume)
+        )
+    }
+
+
+def get_slippage(
+    rpc, amount, fee, balance_a, balance_b, a_id, b_id, from_asset, cer_prices, assets=None
+):
     if from_asset == a_id:
         balance_a, balance_b = balance_b, balance_a
         a_id, b_id = b_id, a_id
 
     cer = cer_prices[b_id] if cer_prices else None
 
-    a_id, b_id = f"1.3.{a_id}", f"1.3.{b_id}"
+    sell = assets.by_instance[a_id].object if assets is not None else None
+    receive = assets.by_instance[b_id].object if assets is not None else None
+    if sell is not None and receive is not None:
+        # the registry already holds both objects, skip the id strings and cache lookups
+        actual_out = quote_exchange(amount, fee, balance_a, balance_b, sell, receive)
+    else:
+        a_id, b_id = f"1.3.{a_id}", f"1.3.{b_id}"
+        actual_out = wrapper(rpc, amount, fee, balance_a, balance_b, a_id, b_id, a_id)
+    actual_price = (balance_a + amount) / (balance_b - actual_out)
 
-    instant_price = balance_a / balance_b
+    return output_slippage(amount, balance_a, balance_b, actual_out, cer), actual_price
 
-    actual_out = wrapper(rpc, amount, fee, balance_a, balance_b, a_id, b_id, a_id)
-    actual_price = (balance_a + amount) / (balance_b - actual_out)
 
-    effective_out = max(0, actual_out - ((1 / cer) if cer_prices else 0))
+def output_slippage(amount, balance_a, balance_b, out, cer):
+    """
+    The slippage score of get_slippage for a given output; it never rises with
+    the output, so a floor under the output puts a ceiling over the score
+    """
+    instant_price = balance_a / balance_b
+
+    effective_out = max(0, out - ((1 / cer) if cer else 0))
     effective_price = (balance_a + amount) / (balance_b - effective_out)
 
-    slippage = instant_price / effective_price
+    return instant_price / effective_price
 
-    return slippage, actual_price
+
+def slippage_bound(amount, fee, balance_a, balance_b, a_id, b_id, from_asset, cer_prices, assets):
+    """
+    Cheap float ceiling on get_slippage for the same edge, or None where only
+    the exact quote will do (no registry objects, or a dust sized trade)
+    """
+    if assets is None:
+        return None
+    if from_asset == a_id:
+        balance_a, balance_b = balance_b, balance_a
+        a_id, b_id = b_id, a_id
+
+    sell = assets.by_instance[a_id].object
+    receive = assets.by_instance[b_id].object
+    if sell is None or receive is None:
+        return None
+    out = output_lower_bound(amount, fee, balance_a, balance_b, sell, receive)
+    if out is None:
+        return None
+    cer = cer_prices[b_id] if cer_prices else None
+    return output_slippage(amount, balance_a, balance_b, out, cer)
 
 
-def bootstrap_prices_from_core(rpc, input_amount, G, base_token, cer_prices=None):
+def edge_quote(rpc, amount, data, known, unknown, cer_prices, assets=None):
     """
-    Bootstraps token prices by propagating outward from a base token.
+    (slippage, price) of trading amount of known across one pool or book edge,
+    None if a book is too thin to fill it
+    """
+    if data.get("book"):
+        return get_book_slippage(amount, data, unknown, cer_prices)
+    return get_slippage(
+        rpc,
+        amount=amount,
+        fee=data["fee"],
+        balance_a=data["bal_a"],
+        balance_b=data["bal_b"],
+        a_id=data["asset_a"],
+        b_id=data["asset_b"],
+        from_asset=known,
+        cer_prices=cer_prices,
+        assets=assets,
+    )
+
+
+def stream_prices_from_core(rpc, input_amount, G, base_token, cer_prices=None, assets=None):
+    """
+    Lazily propagate token prices outward from a base token.
+    ~
+    yields (asset, price, token_path, pool_path) as each asset is settled, best
+    route first, so callers can stop as soon as the asset they need arrives or
+    stream partial price tables while the search continues
+
+    pool edges are screened with slippage_bound first: an edge whose float
+    ceiling cannot beat the best exact score already held for its asset is
+    dropped, otherwise it waits in the heap at that optimistic rank and is only
+    quoted exactly once it reaches the top.  Since the ceiling never ranks an
+    edge below its exact score, every asset settles on the same route as when
+    every edge is quoted exactly (up to exact ties between distinct routes)
     """
-    prices = {base_token: 1.0}
     token_paths = {base_token: [base_token]}
-    pool_paths = {base_token: []}
     minimum_slippage = defaultdict(lambda: float("-inf"))
+    settled = set()
     visited = set()
     heap = []
+    # breaks ties before the screening payload, which does not compare
+    order = itertools.count()
+
+    def relax(base_slippage, known, price_to_here, token_path, pool_path, data, unknown):
+        quote = edge_quote(
+            rpc, price_to_here * input_amount, data, known, unknown, cer_prices, assets
+        )
+        if quote is None:
+            return
+        slippage, price = quote
+
+        core_slippage = (1 - base_slippage) * slippage
+        core_price = price_to_here * price
+
+        if minimum_slippage[unknown] < core_slippage:
+            minimum_slippage[unknown] = core_slippage
+
+            token_paths[unknown] = token_path + [unknown]
+
+            heapq.heappush(
+                heap,
+                (
+                    # the heap selects the smallest item, so we want the largest remaining amount
+                    1 - core_slippage,
+                    unknown,
+                    core_price,
+                    token_paths[unknown],
+                    pool_path + [data["pool"]],
+                    next(order),
+                    None,
+                ),
+            )
 
     # we came from nowhere with 0 slippage and started at base_token.
-    heapq.heappush(heap, (0, base_token, 1, [base_token], []))
+    heapq.heappush(heap, (0, base_token, 1.0, [base_token], [], next(order), None))
 
     while heap:
         (
@@ -83,15 +285,28 @@ def bootstrap_prices_from_core(rpc, input_amount, G, base_token, cer_prices=None
             price_to_here,
             token_path,
             pool_path,
+            _,
+            screened,
         ) = heapq.heappop(heap)
 
-        for _, _, data in G.edges(data=True):
-            if (
-                (known not in (data["asset_a"], data["asset_b"]))
-                or (not data["bal_a"])
-                or (not data["bal_b"])
-                or (data["pool"] in visited)
-            ):
+        if screened is not None:
+            # a screened edge came up for its turn; quote it exactly unless a
+            # better exact score for its asset has landed since it was pushed
+            source, source_slippage, core_bound, data = screened
+            if minimum_slippage[known] < core_bound:
+                relax(source_slippage, source, price_to_here, token_path, pool_path, data, known)
+            continue
+
+        # the first pop of an asset carries its best slippage, later pops are stale
+        if known not in settled:
+            settled.add(known)
+            yield known, price_to_here, token_path, pool_path
+
+        if known not in G:
+            continue
+
+        for _, _, data in G.edges(known, data=True):
+            if (not data["bal_a"]) or (not data["bal_b"]) or (data["pool"] in visited):
                 continue
 
             visited.add(data["pool"])
@@ -100,43 +315,269 @@ def bootstrap_prices_from_core(rpc, input_amount, G, base_token, cer_prices=None
 
             unknown = data["asset_b"] if a_is_known else data["asset_a"]
 
-            slippage, price = get_slippage(
-                rpc,
-                amount=price_to_here * input_amount,
-                fee=data["fee"],
-                balance_a=data["bal_a"],
-                balance_b=data["bal_b"],
-                a_id=data["asset_a"],
-                b_id=data["asset_b"],
-                from_asset=known,
-                cer_prices=cer_prices,
+            bound = None
+            if not data.get("book"):
+                bound = slippage_bound(
+                    price_to_here * input_amount,
+                    data["fee"],
+                    data["bal_a"],
+                    data["bal_b"],
+                    data["asset_a"],
+                    data["asset_b"],
+                    known,
+                    cer_prices,
+                    assets,
+                )
+            if bound is None:
+                relax(base_slippage, known, price_to_here, token_path, pool_path, data, unknown)
+                continue
+
+            core_bound = (1 - base_slippage) * bound
+            if minimum_slippage[unknown] >= core_bound:
+                continue
+            heapq.heappush(
+                heap,
+                (
+                    1 - core_bound,
+                    unknown,
+                    price_to_here,
+                    token_path,
+                    pool_path,
+                    next(order),
+                    (known, base_slippage, core_bound, data),
+                ),
             )
 
-            core_slippage = (1 - base_slippage) * slippage
-            core_price = price_to_here * price
-
-            if minimum_slippage[unknown] < core_slippage:
-                minimum_slippage[unknown] = core_slippage
-
-                prices[unknown] = core_price
-                token_paths[unknown] = token_path + [unknown]
-                pool_paths[unknown] = pool_path + [data["pool"]]
-
-                heapq.heappush(
-                    heap,
-                    (
-                        # the heap selects the smallest item, so we want the largest remaining amount
-                        1 - core_slippage,
-                        unknown,
-                        core_price,
-                        token_paths[unknown],
-                        pool_paths[unknown],
-                    ),
-                )
+
+def bootstrap_prices_from_core(
+    rpc, input_amount, G, base_token, cer_prices=None, target=None, assets=None
+):
+    """
+    Bootstraps token prices by propagating outward from a base token.
+    ~
+    when a target is given the search stops once that asset is settled and the
+    tables only hold the assets priced on the way there
+    """
+    prices = {}
+    token_paths = {}
+    pool_paths = {}
+    for asset, price, token_path, pool_path in stream_prices_from_core(
+        rpc, input_amount, G, base_token, cer_prices, assets
+    ):
+        prices[asset] = price
+        token_paths[asset] = token_path
+        pool_paths[asset] = pool_path
+        if asset == target:
+            break
 
     return prices, token_paths, pool_paths
 
 
+def hop_distances(G, source, target, max_hops):
+    """
+    Meet in the middle hop counts from both ends of a query
+    ~
+    breadth first layers are grown from source and target alike, always on the
+    smaller frontier, until the two depths add up to max_hops; any route of at
+    most max_hops pools then passes through a node both sides reached.  Returns
+    the (distances, depth, exhausted) of each side, or None when the frontiers
+    never join and no such route exists
+    """
+    sides = [[{source: 0}, [source], 0], [{target: 0}, [target], 0]]
+    while sides[0][2] + sides[1][2] < max_hops and (sides[0][1] or sides[1][1]):
+        side = min((side for side in sides if side[1]), key=lambda side: len(side[1]))
+        distances, frontier, depth = side
+        layer = []
+        for node in frontier:
+            for neighbor in G.adj[node]:
+                if neighbor not in distances:
+                    distances[neighbor] = depth + 1
+                    layer.append(neighbor)
+        side[1] = layer
+        side[2] = depth + 1
+
+    from_source, from_target = sides[0][0], sides[1][0]
+    if not any(
+        distance + from_target[node] <= max_hops
+        for node, distance in from_source.items()
+        if node in from_target
+    ):
+        return None
+    return tuple((distances, depth, not frontier) for distances, frontier, depth in sides)
+
+
+def hop_bound(side, node):
+    """
+    Fewest hops node can be from one side of hop_distances
+    """
+    distances, depth, exhausted = side
+    if node in distances:
+        return distances[node]
+    return float("inf") if exhausted else depth + 1
+
+
+def route_between(rpc, input_amount, G, source, target, max_hops=4, cer_prices=None, assets=None):
+    """
+    Best route of at most max_hops pools from source to target
+    ~
+    scored with the same exact quotes as stream_prices_from_core, and screened
+    the same way with slippage_bound, but an edge is only considered if the
+    target is still reachable within the hop budget from its far end, by the
+    target side bounds of hop_distances.  Labels are kept per (asset, hops), so
+    a shorter but worse route into an asset survives when the better one would
+    run out of hops.  Returns (price, token_path, pool_path), or None when no
+    route fits
+    """
+    if source == target:
+        return 1.0, [source], []
+    if source not in G or target not in G:
+        return None
+    bounds = hop_distances(G, source, target, max_hops)
+    if bounds is None:
+        return None
+    to_target = bounds[1]
+
+    best = defaultdict(dict)
+    heap = []
+    order = itertools.count()
+
+    def dominated(asset, hops, core_slippage):
+        # a label is only worth keeping if no route with as few hops beats it
+        return any(seen >= core_slippage for count, seen in best[asset].items() if count <= hops)
+
+    def relax(base_slippage, known, price_to_here, token_path, pool_path, data, unknown):
+        quote = edge_quote(
+            rpc, price_to_here * input_amount, data, known, unknown, cer_prices, assets
+        )
+        if quote is None:
+            return
+        slippage, price = quote
+        core_slippage = (1 - base_slippage) * slippage
+        hops = len(pool_path) + 1
+        if dominated(unknown, hops, core_slippage):
+            return
+        best[unknown][hops] = core_slippage
+        heapq.heappush(
+            heap,
+            (
+                1 - core_slippage,
+                unknown,
+                price_to_here * price,
+                token_path + [unknown],
+                pool_path + [data["pool"]],
+                next(order),
+                None,
+            ),
+        )
+
+    heapq.heappush(heap, (0, source, 1.0, [source], [], next(order), None))
+    while heap:
+        base_slippage, known, price_to_here, token_path, pool_path, _, screened = heapq.heappop(
+            heap
+        )
+        if screened is not None:
+            source_slippage, core_bound, data, unknown = screened
+            if not dominated(unknown, len(pool_path) + 1, core_bound):
+                relax(source_slippage, known, price_to_here, token_path, pool_path, data, unknown)
+            continue
+        if known == target:
+            return price_to_here, token_path, pool_path
+
+        hops = len(pool_path) + 1
+        for _, unknown, data in G.edges(known, data=True):
+            if unknown in token_path or hops + hop_bound(to_target, unknown) > max_hops:
+                continue
+            if (not data["bal_a"]) or (not data["bal_b"]):
+                continue
+
+            bound = None
+            if not data.get("book"):
+                bound = slippage_bound(
+                    price_to_here * input_amount,
+                    data["fee"],
+                    data["bal_a"],
+                    data["bal_b"],
+                    data["asset_a"],
+                    data["asset_b"],
+                    known,
+                    cer_prices,
+                    assets,
+                )
+            if bound is None:
+                relax(base_slippage, known, price_to_here, token_path, pool_path, data, unknown)
+                continue
+
+            core_bound = (1 - base_slippage) * bound
+            if dominated(unknown, hops, core_bound):
+                continue
+            heapq.heappush(
+                heap,
+                (
+                    1 - core_bound,
+                    known,
+                    price_to_here,
+                    token_path,
+                    pool_path,
+                    next(order),
+                    (base_slippage, core_bound, data, unknown),
+                ),
+            )
+    return None
+
+
+def quote_route(input_amount, token_path, pool_path, balance_data, assets):
+    """
+    Exact per hop quotes for trading input_amount along a route, with the
+    precisions needed to turn them into a transaction; None for book routes
+    ~
+    every hop is quoted at the whole satoshi amount it sells, which is the
+    previous hop's quoted output, so the satoshi fields chain exactly
+    """
+    if any(pool_id not in balance_data for pool_id in pool_path):
+        return None
+    hops = []
+    amount = input_amount
+    for (sell, receive), pool_id in zip(itertools.pairwise(token_path), pool_path):
+        bal_a, bal_b, asset_a, _, fee, _ = balance_data[pool_id]
+        balance_sell, balance_receive = (bal_a, bal_b) if sell == asset_a else (bal_b, bal_a)
+        sell, receive = assets.by_instance[sell], assets.by_instance[receive]
+        amount_sat = round(amount * sell.scale)
+        amount = amount_sat / sell.scale
+        expected = quote_exchange(
+            amount, fee, balance_sell, balance_receive, sell.object, receive.object
+        )
+        hops.append(
+            {
+                "pool": pool_id,
+                "asset_id_to_sell": sell.id,
+                "asset_id_to_receive": receive.id,
+                "amount_to_sell": amount,
+                "expected": expected,
+                "amount_to_sell_sat": amount_sat,
+                "expected_sat": round(expected * receive.scale),
+                "precision_to_sell": sell.precision,
+                "precision_to_receive": receive.precision,
+            }
+        )
+        amount = expected
+    return hops
+
+
+def route_price(rpc, input_amount, token_path, pool_path, balance_data, assets=None):
+    """
+    The price the search settles on for a route, walked hop by hop along the
+    fixed path, so a cached route is priced exactly as a fresh search would
+    """
+    price = 1.0
+    for known, pool_id in zip(token_path, pool_path):
+        bal_a, bal_b, asset_a, asset_b, fee, _ = balance_data[pool_id]
+        _, hop_price = get_slippage(
+            rpc, price * input_amount, fee, bal_a, bal_b, asset_a, asset_b, known, None, assets
+        )
+        price *= hop_price
+    return price
+
+
 def load_pool_data():
     data = requests.get(
         "https://raw.githubusercontent.com/squidKid-deluxe/bitshares-networks/refs/heads/gh-pages/pools/pipe/pool_cache.txt"
@@ -162,14 +603,14 @@ def load_precisions():
 def rpc_chunk_objects(rpc, ids, limit=100):
     chunks = [ids[i : i + limit] for i in range(0, len(ids), limit)]
     results = {}
-    print(f"Requesting {len(chunks)} chunks...")
+    logger.info(f"Requesting {len(chunks)} chunks...")
     for chunk_num, chunk in enumerate(chunks, start=1):
-        print(f"chunk {chunk_num}")
+        logger.debug(f"chunk {chunk_num}")
         try:
             objects = rpc_get_objects(rpc, chunk)
             results.update(objects)
         except Exception as e:
-            print(f"An error occurred processing chunk {chunk_num}: {e}")
+            logger.warning(f"An error occurred processing chunk {chunk_num}: {e}")
     return results
 
 
@@ -197,7 +638,28 @@ def sigfig(number, precision=6):
     return format_thousands(round(number, precision - int(math.floor(math.log10(abs(number))))))
 
 
-def generate_all_prices(rpc, input_amount, pools, cache, core, mock=False):
+def print_feed_premiums(feeds, prices, assets, count=10):
+    """
+    Show the MPAs whose pool price strays furthest from their oracle feed
+    """
+    instances, oracle = oracle_prices(feeds, prices)
+    premiums = feed_premiums(instances, oracle, prices)
+    valued = ~np.isnan(premiums)
+    instances, premiums = instances[valued], premiums[valued]
+    order = np.argsort(-np.abs(premiums))[:count]
+    logger.info("\nMPA FEEDS\n")
+    logger.info("Symbol           Premium")
+    for idx in order.tolist():
+        logger.info(f"{assets.symbol(int(instances[idx])).ljust(16)} {premiums[idx]:+.2%}")
+
+
+def fetch_balance_data(rpc, pools, cache, assets=None, mock=False):
+    """
+    Current balances of a list of pools as balance_data
+    ~
+    also makes sure every pool asset's object is fetched and attached to the
+    registry for quoting; returns (balance_data, assets)
+    """
     if mock:
         pool_data = parse_pool_data(mock_rpc_chunk_objects(pools), cache)
     else:
@@ -208,7 +670,14 @@ def generate_all_prices(rpc, input_amount, pools, cache, core, mock=False):
         all_assets.add(pool[4])
         all_assets.add(pool[5])
 
-    rpc_chunk_objects(rpc, list(all_assets))
+    if mock:
+        # the mock assets carry their own fee-free objects, there is no node to ask
+        rpc_get_objects.cache = {**getattr(rpc_get_objects, "cache", {}), **cache}
+    else:
+        rpc_chunk_objects(rpc, list(all_assets))
+    if assets is None:
+        assets = AssetRegistry(cache)
+    assets.attach_objects(rpc_get_objects.cache)
 
     balance_data = {
         pool_id: (
@@ -221,17 +690,89 @@ def generate_all_prices(rpc, input_amount, pools, cache, core, mock=False):
         )
         for pool_id, balance_info in pool_data.items()
     }
+    return balance_data, assets
+
+
+def generate_all_prices(
+    rpc,
+    input_amount,
+    pools,
+    cache,
+    core,
+    mock=False,
+    target=None,
+    hybrid=False,
+    history=None,
+    prune=None,
+    report=None,
+    assets=None,
+    feeds=None,
+    balance_data=None,
+    max_hops=None,
+):
+    """
+    Price every asset from core over the pool graph
+    ~
+    prune=(min_tvl, min_volume) routes over only the pools above those core
+    valued thresholds, falling back to the full graph if the target is cut off;
+    prune=None searches the full graph exactly.  report is a file prefix to
+    export the network liquidity report to, valued in the CER prices; feeds is
+    a FeedCache whose oracle prices are compared against the CER prices;
+    balance_data skips the pool fetch when the caller already holds it.  With a
+    target, max_hops swaps the outward search for the hop-bounded route_between,
+    and the tables then only hold the target
+    """
+    if balance_data is None:
+        balance_data, assets = fetch_balance_data(rpc, pools, cache, assets, mock)
+    if history is not None:
+        history.record(balance_data)
     graph = build_graph(balance_data)
+    if hybrid and not mock:
+        # order books for every pool pair ride alongside the pools as extra edges
+        add_book_edges(graph, BOOKS.get(rpc, book_markets(graph)), assets)
 
     # First pass: Feeless to get CER prices
-    cer_prices, token_paths, pool_paths = bootstrap_prices_from_core(rpc, 1, graph, base_token=0)
-
-    return (
-        bootstrap_prices_from_core(rpc, input_amount, graph, core, cer_prices=cer_prices),
-        balance_data,
-        graph,
+    cer_prices, token_paths, pool_paths = bootstrap_prices_from_core(
+        rpc, 1, graph, base_token=0, assets=assets
     )
 
+    def search(graph):
+        if max_hops is None or target is None:
+            return bootstrap_prices_from_core(
+                rpc, input_amount, graph, core, cer_prices=cer_prices, target=target, assets=assets
+            )
+        route = route_between(rpc, input_amount, graph, core, target, max_hops, cer_prices, assets)
+        if route is None:
+            return {}, {}, {}
+        price, token_path, pool_path = route
+        return {target: price}, {target: token_path}, {target: pool_path}
+
+    volumes = None
+    if not mock and (report is not None or (prune is not None and prune[1])):
+        volumes = get_liquidity_pool_volume(rpc, pools)
+
+    if feeds is not None:
+        print_feed_premiums(feeds.refresh(rpc, assets), cer_prices, assets)
+
+    if report is not None:
+        write_report(liquidity_report(balance_data, cer_prices, volumes, assets), report, assets)
+
+    if prune is not None:
+        min_tvl, min_volume = prune
+        liquidity = pool_liquidity(balance_data, cer_prices, volumes, assets)
+        pruned = build_graph(prune_pools(balance_data, liquidity, min_tvl, min_volume))
+        if hybrid and not mock:
+            add_book_edges(pruned, BOOKS.get(rpc, book_markets(pruned)), assets)
+        logger.info(
+            f"Pruned graph keeps {pruned.number_of_edges()} of {graph.number_of_edges()} edges"
+        )
+        prices = search(pruned)
+        if target is None or target in prices[0]:
+            return prices, balance_data, pruned
+        logger.info("Target unreachable in the pruned graph, searching the full graph")
+
+    return search(graph), balance_data, graph
+
 
 def load_mock_pool_data():
     return [
@@ -244,7 +785,7 @@ def load_mock_pool_data():
 
 
 def load_mock_precisions():
-    return {
+    precisions = {
         "1.3.0": {"symbol": "BTS", "precision": 5},
         "1.3.1": {"symbol": "USD", "precision": 4},
         "1.3.2": {"symbol": "EUR", "precision": 4},
@@ -252,6 +793,11 @@ def load_mock_precisions():
         "1.3.121": {"symbol": "XBTSX.USDT", "precision": 6},
         "1.3.861": {"symbol": "HONEST.MONEY", "precision": 6},
     }
+    options = {"market_fee_percent": 0, "max_market_fee": "0", "flags": 0, "extensions": {}}
+    return {
+        asset_id: {**info, "id": asset_id, "options": options}
+        for asset_id, info in precisions.items()
+    }
 
 
 def mock_rpc_chunk_objects(ids):
@@ -311,6 +857,19 @@ def main(
     mock=False,
     result_holder=None,
     plot=False,
+    rpc=None,
+    hybrid=False,
+    history=None,
+    pool_data=None,
+    precisions=None,
+    prune=None,
+    report=None,
+    assets=None,
+    feeds=False,
+    live=None,
+    route_cache=False,
+    max_hops=None,
+    hedged=False,
 ):
     """
     parser = argparse.ArgumentParser(
@@ -334,64 +893,121 @@ def main(
         cache = load_mock_precisions()
         rpc = None
     else:
-        data = load_pool_data()
-        cache = load_precisions()
-        rpc = wss_handshake()
+        # recorded fixtures supply these for offline replays
+        data = pool_data if pool_data is not None else load_pool_data()
+        if precisions is not None:
+            cache = precisions
+        elif assets is not None:
+            # a shared registry already holds every precision
+            cache = assets.precisions()
+        else:
+            cache = load_precisions()
+        if rpc is None:
+            # hedged spreads requests over several nodes to cut tail latency
+            rpc = HedgedRPC() if hedged else wss_handshake()
+
+    if assets is None:
+        assets = AssetRegistry(cache)
 
-    if not any(v["symbol"] == from_token for v in cache.values()):
-        print(f"Invalid 'from' token: {from_token}")
+    if from_token not in assets.by_symbol:
+        logger.error(f"Invalid 'from' token: {from_token}")
         return
 
-    if not any(v["symbol"] == to_token for v in cache.values()):
-        print(f"Invalid 'to' token: {to_token}")
+    if to_token not in assets.by_symbol:
+        logger.error(f"Invalid 'to' token: {to_token}")
         return
 
-    FROM_ID = [int(k.split(".")[2]) for k, v in cache.items() if v["symbol"] == from_token][0]
-    TO_ID = [int(k.split(".")[2]) for k, v in cache.items() if v["symbol"] == to_token][0]
+    FROM_ID = assets.by_symbol[from_token].instance
+    TO_ID = assets.by_symbol[to_token].instance
 
     pools = [i[0] for i in data]
     core = FROM_ID
 
-    (prices, token_paths, pool_paths), balance_data, graph = generate_all_prices(
-        rpc, input_amount, pools, cache, core, mock=mock
-    )
+    # a cached route skips the search, but reports and feeds need the full pass
+    route_cache = route_cache and report is None and not feeds
+    mode = (prune, hybrid, max_hops)
+    balance_data = None
+    cached = None
+    if route_cache:
+        balance_data, assets = fetch_balance_data(rpc, pools, cache, assets, mock)
+        cached = ROUTES.get(FROM_ID, TO_ID, input_amount, balance_data, mode)
+
+    if cached is not None:
+        token_path, pool_path = cached
+        price = route_price(rpc, input_amount, token_path, pool_path, balance_data, assets)
+        prices = {TO_ID: price}
+        token_paths, pool_paths = {TO_ID: token_path}, {TO_ID: pool_path}
+        graph = None
+        if history is not None:
+            history.record(balance_data)
+    else:
+        (prices, token_paths, pool_paths), balance_data, graph = generate_all_prices(
+            rpc,
+            input_amount,
+            pools,
+            cache,
+            core,
+            mock=mock,
+            target=TO_ID,
+            hybrid=hybrid,
+            history=history,
+            prune=prune,
+            report=report,
+            assets=assets,
+            feeds=FEEDS if feeds and not mock else None,
+            balance_data=balance_data,
+            max_hops=max_hops,
+        )
+        if route_cache and TO_ID in token_paths:
+            ROUTES.put(
+                FROM_ID,
+                TO_ID,
+                input_amount,
+                token_paths[TO_ID],
+                pool_paths[TO_ID],
+                balance_data,
+                mode,
+            )
 
-    print("\nPATHS\n")
-    print("Symbol           Price        Path")
+    logger.info("\nPATHS\n")
+    logger.info("Symbol           Price        Path")
     if not TO_ID in token_paths:
-        print(f"No path found from {from_token} to {to_token}")
+        logger.info(f"No path found from {from_token} to {to_token}")
         return
 
     token_path = token_paths[TO_ID]
     pool_path = pool_paths[TO_ID]
-    path_str = " -> ".join([cache[f"1.3.{i}"]["symbol"] for i in token_path])
-    print(
-        cache[f"1.3.{TO_ID}"]["symbol"].ljust(16),
-        str(sigfig(prices[TO_ID])).ljust(16),
-        path_str,
+    path_str = " -> ".join([assets.symbol(i) for i in token_path])
+    logger.info(
+        f"{assets.symbol(TO_ID).ljust(16)} {str(sigfig(prices[TO_ID])).ljust(16)} {path_str}"
     )
 
     if result_holder is not None:
-        # values = []
-        # pool_prices = []
         balances = []
         fees = []
         for token, pool_id in zip(token_path, pool_path):
-            pool = balance_data[pool_id]
-            # asset_a = pool[2]
-            # asset_b = pool[3]
-            # if asset_a in prices and asset_b in prices:
-            #     values.append(pool[0] * prices[asset_a] + pool[1] * prices[asset_b])
-            # pool_prices.append((pool[0] / pool[1]) if asset_a == token else (pool[1] / pool[0]))
+            # order book hops have no pool balances
+            pool = balance_data.get(pool_id)
             balances.append(pool)  # if asset_a == token else (pool[1], pool[0]))
-            fees.append(pool[4])
+            fees.append(pool[4] if pool else None)
 
         result_holder["result"] = [prices[TO_ID], token_path, pool_path, balances, fees]
+        result_holder["quote"] = quote_route(
+            input_amount, token_path, pool_path, balance_data, assets
+        )
         result_holder["rpc"] = rpc
+        result_holder["assets"] = assets
+
+    if live is not None:
+        # push the deltas to an open live map instead of writing a new page
+        live.update(balance_data, assets, [(token_path, pool_path)])
 
     if not plot:
         return
 
+    if graph is None:
+        graph = build_graph(balance_data)
+
     # Create a pyvis network
     net = Network(
         notebook=False, height="750px", width="100%", bgcolor="#222222", font_color="white"
@@ -401,7 +1017,7 @@ def main(
     # Set labels and colors
     for node in net.nodes:
         node_id = node["id"]
-        node["label"] = cache.get(f"1.3.{node_id}", {}).get("symbol", str(node_id))
+        node["label"] = assets.symbol(node_id)
         if node_id in token_path:
             node["color"] = "skyblue"
 
@@ -418,40 +1034,11 @@ def main(
             edge["color"] = "gray"
             edge["width"] = 1.0
 
-    net.set_options(
-        """
-    var options = {
-      "nodes": {
-        "font": {
-          "size": 12
-        }
-      },
-      "edges": {
-        "color": {
-          "inherit": true
-        },
-        "smooth": {
-          "type": "continuous"
-        }
-      },
-      "physics": {
-        "forceAtlas2Based": {
-          "gravitationalConstant": -50,
-          "centralGravity": 0.01,
-          "springLength": 230,
-          "springConstant": 0.08,
-          "damping": 0.4,
-          "avoidOverlap": 0
-        },
-        "minVelocity": 0.75,
-        "solver": "forceAtlas2Based"
-      }
-    }
-    """
-    )
+    net.set_options(PLOT_OPTIONS)
 
     net.show(f"liquidity_pool_map.html", notebook=False)
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     main()
@@ -0,0 +1,364 @@
+"""
+Record and replay BitShares RPC traffic for reproducible offline runs.
+
+RecordingRPC wraps a live connection and captures every reply to a fixture
+file; ReplayNode serves a fixture from a local websocket server with
+configurable latency and failure injection, so the real network path
+(wss_query, RPCMultiplexer, HedgedRPC) is exercised without the internet.
+
+    python replay.py record fixture.json --from XBTSX.USDT --to HONEST.MONEY
+    python replay.py serve fixture.json --port 8090 --latency 0.05 --drop 0.01
+
+then point an analysis at the stand-in node with the fixture's http data:
+
+    fixture = load_fixture("fixture.json")
+    poolmap.main(
+        rpc=RPCMultiplexer(node="ws://127.0.0.1:8090"),
+        pool_data=fixture["pool_data"],
+        precisions=fixture["precisions"],
+    )
+"""
+
+# STANDARD PYTHON MODULES
+import argparse
+import base64
+import hashlib
+import logging
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+from json import dump as json_dump
+from json import dumps as json_dumps
+from json import load as json_load
+from json import loads as json_loads
+
+# BITSHARES NETWORK MODULES
+from rpc import wss_handshake
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def call_key(params):
+    return json_dumps(params, sort_keys=True)
+
+
+class RecordingRPC:
+    """
+    Pass requests through to a live rpc and keep every reply for a fixture
+    ~
+    objects and pools are stored by id, so a replay can answer any later
+    combination of ids rather than only the exact batches that were recorded
+    """
+
+    def __init__(self, rpc, path):
+        self.rpc = rpc
+        self.path = path
+        self.lock = threading.Lock()
+        self.fixture = {"objects": {}, "pools": {}, "calls": {}}
+
+    def _send(self, params):
+        if hasattr(self.rpc, "query"):
+            return self.rpc.query(params)
+        self.rpc.send(json_dumps({"method": "call", "params": params, "jsonrpc": "2.0", "id": 1}))
+        return json_loads(self.rpc.recv())
+
+    def _record(self, params, reply):
+        result = reply.get("result")
+        if result is None:
+            return
+        api, method, args = params
+        with self.lock:
+            if method == "get_objects":
+                for object_id, item in zip(args[0], result):
+                    self.fixture["objects"][object_id] = item
+            elif method == "get_liquidity_pools":
+                for item in result:
+                    self.fixture["pools"][item["id"]] = item
+            else:
+                self.fixture["calls"][call_key(params)] = result
+
+    def query(self, params, timeout=None):
+        reply = self._send(params)
+        self._record(params, reply)
+        return reply
+
+    def query_many(self, params_list, timeout=None):
+        if hasattr(self.rpc, "query_many"):
+            replies = self.rpc.query_many(params_list, timeout)
+        else:
+            replies = [self._send(params) for params in params_list]
+        for params, reply in zip(params_list, replies):
+            self._record(params, reply)
+        return replies
+
+    def save(self, **extra):
+        """
+        Write the fixture, with any extra sections such as the http pool list
+        """
+        with self.lock:
+            self.fixture.update(extra)
+            with open(self.path, "w") as f:
+                json_dump(self.fixture, f)
+
+    def close(self):
+        self.save()
+        if hasattr(self.rpc, "close"):
+            self.rpc.close()
+
+
+def load_fixture(path):
+    with open(path) as f:
+        return json_load(f)
+
+
+def fixture_reply(fixture, params, head_block):
+    """
+    The recorded result for a request, or None if it was never recorded
+    """
+    api, method, args = params
+    if method == "get_objects":
+        return [fixture["objects"].get(object_id) for object_id in args[0]]
+    if method == "get_liquidity_pools":
+        return [fixture["pools"][pool] for pool in args[0] if pool in fixture["pools"]]
+    if method == "get_dynamic_global_properties":
+        # the recorded head is frozen, the node's own head advances and can lag
+        return {"head_block_number": head_block}
+    return fixture["calls"].get(call_key(params))
+
+
+def read_frame(rfile):
+    """
+    Read one client websocket frame; returns (opcode, payload) or None on EOF
+    """
+    header = rfile.read(2)
+    if len(header) < 2:
+        return None
+    opcode = header[0] & 0x0F
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", rfile.read(8))[0]
+    mask = rfile.read(4) if header[1] & 0x80 else b"\x00\x00\x00\x00"
+    payload = bytearray(rfile.read(length))
+    for idx in range(len(payload)):
+        payload[idx] ^= mask[idx % 4]
+    return opcode, bytes(payload)
+
+
+def frame(payload, opcode=0x1):
+    """
+    Encode one unmasked server websocket frame
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack(">BB", 0x80 | opcode, length)
+    elif length < 2**16:
+        header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class ReplayHandler(socketserver.StreamRequestHandler):
+    """
+    One websocket client of a ReplayNode; each request is answered on its own
+    timer so slow replies arrive out of order, as they can from a real node
+    """
+
+    def handle(self):
+        headers = {}
+        self.rfile.readline()
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(
+            hashlib.sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest()
+        ).decode()
+        self.wfile.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode()
+        )
+        self.send_lock = threading.Lock()
+        node = self.server.node
+        while True:
+            try:
+                message = read_frame(self.rfile)
+            except OSError:
+                break
+            if message is None or message[0] == 0x8:
+                break
+            opcode, payload = message
+            if opcode == 0x9:
+                self._send(payload, 0xA)
+            elif opcode == 0x1:
+                threading.Thread(
+                    target=self._answer, args=(node, json_loads(payload)), daemon=True
+                ).start()
+
+    def _send(self, payload, opcode=0x1):
+        try:
+            with self.send_lock:
+                self.wfile.write(frame(payload, opcode))
+        except OSError:
+            pass
+
+    def _answer(self, node, request):
+        time.sleep(max(0, node.latency + random.uniform(-node.jitter, node.jitter)))
+        roll = random.random()
+        if roll < node.disconnect_rate:
+            # drop the whole connection, as a node restarting would
+            self.request.shutdown(socket.SHUT_RDWR)
+            return
+        roll -= node.disconnect_rate
+        if roll < node.drop_rate:
+            return
+        roll -= node.drop_rate
+        reply = {"id": request["id"], "jsonrpc": "2.0"}
+        result = fixture_reply(node.fixture, request["params"], node.head_block())
+        if roll < node.error_rate or result is None:
+            reply["error"] = {"code": 1, "message": "no recorded reply for this request"}
+        else:
+            reply["result"] = result
+        self._send(json_dumps(reply).encode())
+
+
+class ReplayNode:
+    """
+    Local websocket stand-in for a BitShares node that replays a fixture
+    ~
+    latency and jitter are in seconds; drop_rate, error_rate and disconnect_rate
+    are per request probabilities of no reply, an error reply, or a dropped
+    connection; head_lag makes the node report a head block that many behind
+    """
+
+    def __init__(
+        self,
+        fixture,
+        port=8090,
+        latency=0.0,
+        jitter=0.0,
+        drop_rate=0.0,
+        error_rate=0.0,
+        disconnect_rate=0.0,
+        head_lag=0,
+    ):
+        self.fixture = load_fixture(fixture) if isinstance(fixture, str) else fixture
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.head_lag = head_lag
+        self.started = time.time()
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", port), ReplayHandler)
+        self.server.daemon_threads = True
+        self.server.node = self
+        self.url = f"ws://127.0.0.1:{self.server.server_address[1]}"
+
+    def head_block(self):
+        # a new block every 3 seconds, like the live chain
+        return int((time.time() - self.started) / 3) + 1000 - self.head_lag
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def record_session(path, from_token, to_token, input_amount=1):
+    """
+    Run one live analysis through a RecordingRPC and save everything it fetched
+    ~
+    the analysis runs with order books, pruning and feeds on, and the 24h pool
+    volumes are fetched even when pruning does not need them, so the fixture
+    replays main with any of hybrid, prune, report, feeds, route_cache or
+    max_hops; rpc_ticker is not used by any analysis and is not recorded
+    """
+    # imported here so serving a fixture does not need the analysis dependencies
+    from poolmap import DEFAULT_PRUNE, load_pool_data, load_precisions
+    from poolmap import main as pathfind
+    from rpc import get_liquidity_pool_volume
+
+    rpc = RecordingRPC(wss_handshake(), path)
+    pool_data = load_pool_data()
+    precisions = load_precisions()
+    pathfind(
+        from_token=from_token,
+        to_token=to_token,
+        input_amount=input_amount,
+        rpc=rpc,
+        pool_data=pool_data,
+        precisions=precisions,
+        hybrid=True,
+        prune=DEFAULT_PRUNE,
+        feeds=True,
+    )
+    # reports and volume pruning read the pool statistics
+    get_liquidity_pool_volume(rpc, [pool[0] for pool in pool_data])
+    rpc.save(pool_data=pool_data, precisions=precisions)
+    rpc.close()
+    logger.info(f"Recorded fixture to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay BitShares RPC traffic.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="Record a live analysis to a fixture.")
+    record.add_argument("fixture")
+    record.add_argument("--from", dest="from_token", default="XBTSX.USDT")
+    record.add_argument("--to", dest="to_token", default="HONEST.MONEY")
+    record.add_argument("--amount", type=float, default=1)
+
+    serve = commands.add_parser("serve", help="Serve a fixture as a local websocket node.")
+    serve.add_argument("fixture")
+    serve.add_argument("--port", type=int, default=8090)
+    serve.add_argument("--latency", type=float, default=0.0)
+    serve.add_argument("--jitter", type=float, default=0.0)
+    serve.add_argument("--drop", type=float, default=0.0)
+    serve.add_argument("--error", type=float, default=0.0)
+    serve.add_argument("--disconnect", type=float, default=0.0)
+    serve.add_argument("--head-lag", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record_session(args.fixture, args.from_token, args.to_token, args.amount)
+        return
+
+    node = ReplayNode(
+        args.fixture,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        drop_rate=args.drop,
+        error_rate=args.error,
+        disconnect_rate=args.disconnect,
+        head_lag=args.head_lag,
+    )
+    logger.info(f"Replaying {args.fixture} on {node.url}")
+    try:
+        node.server.serve_forever()
+    except KeyboardInterrupt:
+        node.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    main()
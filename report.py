@@ -0,0 +1,154 @@
+"""
+Network wide liquidity report from one price table.
+
+Every pool is valued in a single vectorized pass: value locked, depth at a
+fixed slippage in each direction and 24h fee revenue, all in core terms, then
+rolled up per asset and for the whole network and exported as CSV or JSON.
+"""
+
+import csv
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def liquidity_report(balance_data, prices, volumes=None, assets=None, slippage=0.01):
+    """
+    Value every pool against a price table of units per core
+    ~
+    depth is the core value that can be sold into a pool before its execution
+    price, pool fee included, falls short of the spot price by the slippage,
+    x * (s - f) / (1 - s), and zero where the fee alone exceeds it; fee revenue
+    needs the raw 24h volumes from get_liquidity_pool_volume and the
+    AssetRegistry to scale them
+    """
+    pool_ids = list(balance_data)
+    pools = list(balance_data.values())
+    bal_a = np.array([pool[0] for pool in pools], dtype=float)
+    bal_b = np.array([pool[1] for pool in pools], dtype=float)
+    asset_a = np.array([pool[2] for pool in pools], dtype=np.int64)
+    asset_b = np.array([pool[3] for pool in pools], dtype=np.int64)
+    fee = np.array([pool[4] for pool in pools], dtype=float)
+
+    price_a = np.array([prices.get(asset, np.nan) for asset in asset_a.tolist()], dtype=float)
+    price_b = np.array([prices.get(asset, np.nan) for asset in asset_b.tolist()], dtype=float)
+
+    value_a = bal_a / price_a
+    value_b = bal_b / price_b
+    tvl = value_a + value_b
+    # out / dx = (1 - f) * y / (x + dx), equal to (1 - s) * y / x at this size
+    depth_factor = np.maximum(0, slippage - fee / 100) / (1 - slippage)
+
+    fee_revenue = np.full(len(pools), np.nan)
+    volume = np.full(len(pools), np.nan)
+    if volumes is not None and assets is not None:
+        raw = np.array([volumes.get(pool_id, np.nan) for pool_id in pool_ids], dtype=float)
+        scale = np.array(
+            [assets.by_instance[asset].scale for asset in asset_a.tolist()], dtype=float
+        )
+        volume = raw / scale / price_a
+        fee_revenue = volume * fee / 100
+
+    assets, inverse = np.unique(np.concatenate([asset_a, asset_b]), return_inverse=True)
+    asset_tvl = np.bincount(
+        inverse, weights=np.nan_to_num(np.concatenate([value_a, value_b])), minlength=len(assets)
+    )
+
+    return {
+        "slippage": slippage,
+        "pools": {
+            "pool": pool_ids,
+            "asset_a": asset_a,
+            "asset_b": asset_b,
+            "tvl": tvl,
+            "depth_a": value_a * depth_factor,
+            "depth_b": value_b * depth_factor,
+            "volume": volume,
+            "fee_revenue": fee_revenue,
+        },
+        "assets": {"asset": assets, "tvl": asset_tvl},
+        "total": {
+            "tvl": float(np.nansum(tvl)),
+            "volume": float(np.nansum(volume)),
+            "fee_revenue": float(np.nansum(fee_revenue)),
+        },
+    }
+
+
+def symbol(assets, asset):
+    if assets is None:
+        return str(asset)
+    return assets.symbol(asset)
+
+
+def report_rows(report, assets=None):
+    """
+    One dict per pool, largest value locked first
+    """
+    pools = report["pools"]
+    order = np.argsort(-np.nan_to_num(pools["tvl"], nan=-np.inf))
+    columns = ["tvl", "depth_a", "depth_b", "volume", "fee_revenue"]
+    return [
+        {
+            "pool": pools["pool"][idx],
+            "asset_a": symbol(assets, int(pools["asset_a"][idx])),
+            "asset_b": symbol(assets, int(pools["asset_b"][idx])),
+            **{
+                column: None if np.isnan(pools[column][idx]) else float(pools[column][idx])
+                for column in columns
+            },
+        }
+        for idx in order.tolist()
+    ]
+
+
+def write_csv(report, path, assets=None):
+    rows = report_rows(report, assets)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(
+            f,
+            fieldnames=[
+                "pool",
+                "asset_a",
+                "asset_b",
+                "tvl",
+                "depth_a",
+                "depth_b",
+                "volume",
+                "fee_revenue",
+            ],
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_json(report, path, assets=None):
+    totals = report["assets"]
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "slippage": report["slippage"],
+                "total": report["total"],
+                "assets": {
+                    symbol(assets, int(asset)): float(tvl)
+                    for asset, tvl in zip(totals["asset"], totals["tvl"])
+                },
+                "pools": report_rows(report, assets),
+            },
+            f,
+            indent=2,
+        )
+
+
+def write_report(report, prefix, assets=None):
+    """
+    Export a report to prefix.csv (per pool) and prefix.json (pools, assets, total)
+    """
+    write_csv(report, f"{prefix}.csv", assets)
+    write_json(report, f"{prefix}.json", assets)
+    logger.info(
+        f"Network TVL: {report['total']['tvl']:,.2f} core, report saved to {prefix}.csv/.json"
+    )
@@ -0,0 +1,75 @@
+"""
+Cache of complete route results for repeat queries.
+
+A route is cached under (from, to, log-scaled amount bucket, mode) together
+with the balances of every pool it runs through.  A later query for the same
+pair at a similar size reuses the route only while none of those pools has
+changed, and is then re-quoted exactly at its own amount, so most repeat
+queries skip the graph search altogether.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+
+class RouteCache:
+    """
+    Least recently used route results keyed by pair and amount bucket
+    ~
+    per_decade sets the bucket width: amounts within a factor of
+    10 ** (1 / per_decade) of each other share a route.  Only the pools on a
+    route are checked, so a change elsewhere that would open a better route
+    goes unnoticed until one of the route's own pools moves; safe to share
+    between analysis threads
+    """
+
+    def __init__(self, per_decade=4, maxsize=1024):
+        self.per_decade = per_decade
+        self.maxsize = maxsize
+        self.routes = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source, target, amount, mode=()):
+        bucket = math.floor(math.log10(amount) * self.per_decade) if amount > 0 else None
+        return (source, target, bucket, mode)
+
+    def get(self, source, target, amount, balance_data, mode=()):
+        """
+        The cached (token_path, pool_path), or None on a miss or if any pool on
+        the route has changed since it was cached
+        """
+        key = self.key(source, target, amount, mode)
+        with self.lock:
+            entry = self.routes.get(key)
+            if entry is not None and any(
+                balance_data.get(pool_id) != version for pool_id, version in entry[2].items()
+            ):
+                del self.routes[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.routes.move_to_end(key)
+            self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, source, target, amount, token_path, pool_path, balance_data, mode=()):
+        """
+        Cache a route with the balances it was found on; routes through order
+        books are skipped, their depth is not versioned by balance_data
+        """
+        if any(pool_id not in balance_data for pool_id in pool_path):
+            return
+        versions = {pool_id: balance_data[pool_id] for pool_id in pool_path}
+        key = self.key(source, target, amount, mode)
+        with self.lock:
+            self.routes[key] = (token_path, pool_path, versions)
+            self.routes.move_to_end(key)
+            while len(self.routes) > self.maxsize:
+                self.routes.popitem(last=False)
+
+
+ROUTES = RouteCache()
@@ -8,12 +8,18 @@ LIQUIDITY POOL MAPPER
 """
 
 # STANDARD PYTHON MODULES
+import itertools
+import logging
+import queue
+import threading
 import time
+from collections import deque
 from json import dumps as json_dumps
 from json import loads as json_loads
 from random import shuffle
 
 # THIRD PARTY MODULES
+from websocket import WebSocketTimeoutException
 from websocket import create_connection as wss
 
 NODES = [
@@ -31,6 +37,8 @@ NODES = [
     "wss://node.xbts.io/ws",
 ]
 
+logger = logging.getLogger(__name__)
+
 
 def wss_handshake():
     """
@@ -47,25 +55,410 @@ def wss_handshake():
             if time.time() - start < 3:
                 break
         except Exception as e:
-            print(e)
-    print(f"Successfully connected to {node}!")
+            logger.warning(e)
+    logger.info(f"Successfully connected to {node}!")
     return rpc
 
 
+class RPCMultiplexer:
+    """
+    Share one websocket between threads
+    ~
+    every request gets a unique id; a single reader thread receives all replies
+    and hands each one to the caller waiting on that id, so concurrent callers
+    never read each other's responses
+    """
+
+    def __init__(self, rpc=None, timeout=30, node=None):
+        self.node = node
+        self.rpc = rpc if rpc is not None else self._connect()
+        self.timeout = timeout
+        self.ids = itertools.count(1)
+        self.send_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending = {}
+        self.closed = False
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+
+    def query(self, params, timeout=None):
+        """
+        Send a request and block until the reply with the matching id arrives
+        """
+        request_id = next(self.ids)
+        slot = {"event": threading.Event()}
+        with self.pending_lock:
+            self.pending[request_id] = slot
+        try:
+            query = json_dumps(
+                {"method": "call", "params": params, "jsonrpc": "2.0", "id": request_id}
+            )
+            with self.send_lock:
+                self.rpc.send(query)
+            if not slot["event"].wait(self.timeout if timeout is None else timeout):
+                raise TimeoutError(f"no reply to request {request_id}: {params[:2]}")
+        finally:
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+        if "error" in slot:
+            raise slot["error"]
+        return slot["reply"]
+
+    def query_many(self, params_list, timeout=None):
+        """
+        Pipeline several requests on the socket and wait for all of their replies
+        """
+        slots = {next(self.ids): {"event": threading.Event()} for _ in params_list}
+        with self.pending_lock:
+            self.pending.update(slots)
+        try:
+            with self.send_lock:
+                for request_id, params in zip(slots, params_list):
+                    self.rpc.send(
+                        json_dumps(
+                            {"method": "call", "params": params, "jsonrpc": "2.0", "id": request_id}
+                        )
+                    )
+            deadline = time.time() + (self.timeout if timeout is None else timeout)
+            for request_id, slot in slots.items():
+                if not slot["event"].wait(max(0, deadline - time.time())):
+                    raise TimeoutError(f"no reply to batched request {request_id}")
+        finally:
+            with self.pending_lock:
+                for request_id in slots:
+                    self.pending.pop(request_id, None)
+        replies = []
+        for slot in slots.values():
+            if "error" in slot:
+                raise slot["error"]
+            replies.append(slot["reply"])
+        return replies
+
+    def _read_loop(self):
+        """
+        Receive every reply on the socket and route it to its waiting caller
+        """
+        while not self.closed:
+            try:
+                reply = json_loads(self.rpc.recv())
+            except WebSocketTimeoutException:
+                continue
+            except Exception as error:
+                if self.closed:
+                    break
+                logger.warning(f"RPC connection lost: {error}")
+                self._fail_pending(error)
+                try:
+                    # connect without the lock, an unpinned handshake can retry for a
+                    # long time and callers must fail fast on the dead socket meanwhile
+                    rpc = self._connect()
+                    with self.send_lock:
+                        self.rpc = rpc
+                except Exception as reconnect_error:
+                    # a pinned node that will not come back is left for the caller to replace
+                    logger.warning(f"Could not reconnect to {self.node}: {reconnect_error}")
+                    self.closed = True
+                continue
+            with self.pending_lock:
+                slot = self.pending.get(reply.get("id"))
+            if slot is not None:
+                slot["reply"] = reply
+                slot["event"].set()
+
+    def _connect(self):
+        """
+        Connect to the pinned node, or to the first responsive node in NODES
+        """
+        if self.node is None:
+            return wss_handshake()
+        return wss(self.node, timeout=3)
+
+    def _fail_pending(self, error):
+        """
+        Wake every waiting caller with the connection error
+        """
+        with self.pending_lock:
+            slots = list(self.pending.values())
+        for slot in slots:
+            slot["error"] = ConnectionError(f"RPC connection lost: {error}")
+            slot["event"].set()
+
+    def close(self):
+        """
+        Stop the reader thread and close the websocket
+        """
+        self.closed = True
+        try:
+            self.rpc.close()
+        except Exception:
+            pass
+
+
+class HedgedRPC:
+    """
+    Spread requests over several nodes to cut tail latency
+    ~
+    each request goes to the fastest healthy node; if no reply arrives within the
+    chosen percentile of recent latency, a duplicate goes to the next healthy node
+    and whichever reply comes first wins.  A background monitor polls every node's
+    head block and nodes lagging the best head by more than max_lag blocks are
+    excluded until they catch up, so stale nodes can never answer a query.
+    """
+
+    def __init__(
+        self,
+        nodes=None,
+        pool_size=3,
+        percentile=90,
+        max_lag=2,
+        head_interval=3,
+        timeout=30,
+        history=200,
+    ):
+        self.nodes = list(nodes or NODES)
+        self.pool_size = pool_size
+        self.percentile = percentile
+        self.max_lag = max_lag
+        self.head_interval = head_interval
+        self.timeout = timeout
+        self.latencies = deque(maxlen=history)
+        self.node_latency = {}
+        self.heads = {}
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        self._fill_pool()
+        if not self.connections:
+            raise ConnectionError("no BitShares node could be reached")
+        self._check_heads()
+        self.monitor = threading.Thread(target=self._monitor_heads, daemon=True)
+        self.monitor.start()
+
+    def _fill_pool(self):
+        """
+        Open connections until pool_size nodes are connected or none are left
+        """
+        with self.lock:
+            nodes = list(self.nodes)
+        for node in nodes:
+            with self.lock:
+                if len(self.connections) >= self.pool_size:
+                    return
+                if node in self.connections:
+                    continue
+            try:
+                connection = RPCMultiplexer(node=node, timeout=self.timeout)
+            except Exception as error:
+                logger.warning(f"Skipping {node}: {error}")
+                continue
+            with self.lock:
+                self.connections[node] = connection
+            logger.info(f"Successfully connected to {node}!")
+
+    def _drop(self, node):
+        """
+        Close a failed node and connect a replacement
+        """
+        with self.lock:
+            connection = self.connections.pop(node, None)
+            self.heads.pop(node, None)
+            # rotate the failed node to the back so a replacement is tried first
+            self.nodes.remove(node)
+            self.nodes.append(node)
+        if connection is not None:
+            connection.close()
+        self._fill_pool()
+
+    def _check_heads(self):
+        """
+        Record the head block of every connected node
+        """
+        with self.lock:
+            connections = list(self.connections.items())
+        for node, connection in connections:
+            if connection.closed:
+                self._drop(node)
+                continue
+            try:
+                ret = connection.query(
+                    ["database", "get_dynamic_global_properties", []], timeout=self.head_interval
+                )
+                head = int(ret["result"]["head_block_number"])
+            except Exception as error:
+                logger.warning(f"Head block check failed for {node}: {error}")
+                self._drop(node)
+                continue
+            with self.lock:
+                # the node may have been dropped while its head was in flight
+                if self.connections.get(node) is connection:
+                    self.heads[node] = head
+
+    def _monitor_heads(self):
+        """
+        Poll head blocks in the background so queries never wait on health checks
+        """
+        while not self.closed:
+            time.sleep(self.head_interval)
+            self._check_heads()
+
+    def healthy_nodes(self):
+        """
+        Connected nodes within max_lag blocks of the best head, fastest first
+        """
+        with self.lock:
+            if not self.heads:
+                return []
+            best = max(self.heads.values())
+            nodes = [
+                node
+                for node, head in self.heads.items()
+                if best - head <= self.max_lag
+                and node in self.connections
+                and not self.connections[node].closed
+            ]
+        return sorted(nodes, key=lambda node: self.node_latency.get(node, 0))
+
+    def hedge_delay(self):
+        """
+        Seconds to wait on the primary node before sending a duplicate request
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < 10:
+            # not enough history yet, hedge after a conservative fixed delay
+            return 0.5
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))]
+
+    def query(self, params, timeout=None):
+        """
+        Send a request, hedging to a second healthy node if the first is slow
+        """
+        timeout = self.timeout if timeout is None else timeout
+        nodes = self.healthy_nodes()
+        if not nodes:
+            self._check_heads()
+            nodes = self.healthy_nodes()
+        if not nodes:
+            raise ConnectionError("no healthy BitShares node available")
+
+        replies = queue.Queue()
+        # monotonic like queue.get's own timeout, a wall clock step cannot skew it
+        start = time.monotonic()
+
+        def attempt(node):
+            try:
+                replies.put((node, self.connections[node].query(params, timeout), None))
+            except Exception as error:
+                replies.put((node, None, error))
+
+        threading.Thread(target=attempt, args=(nodes[0],), daemon=True).start()
+        launched = outstanding = 1
+        error = None
+        deadline = start + timeout
+        while True:
+            wait = deadline - time.monotonic()
+            if launched < min(2, len(nodes)):
+                wait = min(wait, start + self.hedge_delay() - time.monotonic())
+            try:
+                node, reply, error = replies.get(timeout=max(0, wait))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"no reply within {timeout}s: {params[:2]}")
+                if launched < min(2, len(nodes)):
+                    # the primary is slower than usual, race a duplicate against it
+                    threading.Thread(target=attempt, args=(nodes[launched],), daemon=True).start()
+                    launched += 1
+                    outstanding += 1
+                continue
+            outstanding -= 1
+            if reply is not None and node in self.healthy_nodes():
+                elapsed = time.monotonic() - start
+                with self.lock:
+                    self.latencies.append(elapsed)
+                    self.node_latency[node] = elapsed
+                return reply
+            if error is not None:
+                logger.warning(f"Request to {node} failed: {error}")
+            if not outstanding:
+                # every attempt so far failed or came from a node that fell behind
+                if launched >= len(nodes):
+                    raise ConnectionError(f"RPC request failed on every healthy node: {error}")
+                threading.Thread(target=attempt, args=(nodes[launched],), daemon=True).start()
+                launched += 1
+                outstanding = 1
+
+    def query_many(self, params_list, timeout=None):
+        """
+        Pipeline a batch on the fastest healthy node, failing over node by node
+        """
+        error = None
+        for node in self.healthy_nodes():
+            try:
+                return self.connections[node].query_many(params_list, timeout)
+            except Exception as node_error:
+                logger.warning(f"Batch request to {node} failed: {node_error}")
+                error = node_error
+        raise ConnectionError(f"RPC batch failed on every healthy node: {error}")
+
+    def close(self):
+        """
+        Stop the head monitor and close every connection
+        """
+        self.closed = True
+        with self.lock:
+            connections = list(self.connections.values())
+        for connection in connections:
+            connection.close()
+
+
 def wss_query(rpc, params):
     """
     Send and receive websocket requests
+    ~
+    rpc may be a bare websocket or any object with a query() method, such as
+    RPCMultiplexer, which correlates replies by id for thread safe use
     """
-    query = json_dumps({"method": "call", "params": params, "jsonrpc": "2.0", "id": 1})
-    rpc.send(query)
-    ret = json_loads(rpc.recv())
+    if hasattr(rpc, "query"):
+        ret = rpc.query(params)
+    else:
+        query = json_dumps({"method": "call", "params": params, "jsonrpc": "2.0", "id": 1})
+        rpc.send(query)
+        ret = json_loads(rpc.recv())
     try:
         ret = ret["result"]  # if there is result key take it
     except Exception:
-        print(ret)
+        logger.warning(ret)
     return ret
 
 
+def wss_query_batch(rpc, params_list):
+    """
+    Send many websocket requests at once and return their results in order
+    ~
+    the requests are pipelined rather than sent one round trip at a time
+    """
+    if hasattr(rpc, "query_many"):
+        replies = rpc.query_many(params_list)
+    elif hasattr(rpc, "query"):
+        replies = [rpc.query(params) for params in params_list]
+    else:
+        for request_id, params in enumerate(params_list):
+            rpc.send(
+                json_dumps({"method": "call", "params": params, "jsonrpc": "2.0", "id": request_id})
+            )
+        by_id = {}
+        for _ in params_list:
+            reply = json_loads(rpc.recv())
+            by_id[reply.get("id")] = reply
+        replies = [by_id.get(request_id, {}) for request_id in range(len(params_list))]
+    results = []
+    for reply in replies:
+        if "result" not in reply:
+            logger.warning(reply)
+        results.append(reply.get("result"))
+    return results
+
+
 def rpc_get_objects(rpc, object_ids):
     """
     Return data about objects in 1.7.x, 2.4.x, 1.3.x, etc. format
@@ -117,6 +510,20 @@ def rpc_ticker(rpc, pair):
     return float(ticker["latest"])
 
 
+def rpc_order_books(rpc, markets, limit=50):
+    """
+    RPC the order books of many markets in one pipelined batch
+    ~
+    :param markets: iterable of (base, quote) asset id pairs
+    :RPC returns: {(base, quote): {"bids": [...], "asks": [...]}} in human terms
+    """
+    markets = list(markets)
+    books = wss_query_batch(
+        rpc, [["database", "get_order_book", [base, quote, limit]] for base, quote in markets]
+    )
+    return {market: book for market, book in zip(markets, books) if book is not None}
+
+
 def get_max_object(rpc, space):
     """
     get the maximum object id within this instance space
@@ -144,35 +551,45 @@ def get_max_object(rpc, space):
     return max_object
 
 
-def get_liquidity_pool_volume(rpc, pools):
+def get_liquidity_pool_volume(rpc, pools, limit=100):
     """
     get the sum amount a volume for a given set of liquidity pools
+    ~
+    the pools are requested in pipelined chunks rather than one call per chunk
     """
+    pools = list(pools)
+    chunks = [pools[i : i + limit] for i in range(0, len(pools), limit)]
+    results = wss_query_batch(
+        rpc, [["database", "get_liquidity_pools", [chunk, False, True]] for chunk in chunks]
+    )
     return {
         i["id"]: (
             int(i["statistics"]["_24h_exchange_a2b_amount_a"])
             + int(i["statistics"]["_24h_exchange_b2a_amount_a"])
         )
-        for i in wss_query(rpc, ["database", "get_liquidity_pools", [pools, False, True]])
+        for result in results
+        if result
+        for i in result
     }
 
 
 def rpc_get_feed(rpc, data_id):
     """
     return the oracle feed price for a given MPA
+    ~
+    see feeds.FeedCache to price every MPA in one batch
     """
     # given the bitasset_data_id, get the median feed price
     feed = rpc_get_objects(rpc, [data_id])[data_id]["median_feed"]["settlement_price"]
-    # calculate the base feed amount in human terms
-    base = int(feed["base"]["amount"])
     base_asset_id = feed["base"]["asset_id"]
-    base_precision = int(rpc_get_objects(rpc, [base_asset_id])[base_asset_id]["precision"])
-    # calculate the quote feed amount in human terms
-    quote = int(feed["quote"]["amount"])
     quote_asset_id = feed["quote"]["asset_id"]
-    quote_precision = int(rpc_get_objects(rpc, [quote_asset_id])[quote_asset_id]["precision"])
+    # both precisions in one request
+    assets = rpc_get_objects(rpc, [base_asset_id, quote_asset_id])
+    # calculate the base and quote feed amounts in human terms
+    base = int(feed["base"]["amount"]) / 10 ** int(assets[base_asset_id]["precision"])
+    quote = int(feed["quote"]["amount"]) / 10 ** int(assets[quote_asset_id]["precision"])
     # convert fractional human price to floating point
-    return (base / 10**base_precision) / (quote / 10**quote_precision)
+    return base / quote
 
 
 def get_account_by_name(rpc, account_name):
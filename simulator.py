@@ -0,0 +1,108 @@
+"""
+Copy-on-write simulation of trade sequences over liquidity pool balances.
+
+Pools are the balance_data tuples from poolmap.generate_all_prices:
+(bal_a, bal_b, asset_a, asset_b, fee, withdrawal_fee).  Every trade applies the
+exact min_to_receive math and writes the updated tuple into the top layer of a
+ChainMap, so a branch costs at most two empty dicts and thousands of what-if branches
+share the untouched pools of their parent instead of deep copying them.
+"""
+
+from collections import ChainMap
+from decimal import Decimal
+
+from assets import AssetRegistry
+from min_to_receive import calculate_exchange
+from rpc import rpc_get_objects
+
+
+class PoolSimulator:
+    """
+    Pool balances that trades update in place, with cheap branching
+    ~
+    branching freezes the parent's trades into the layers it shares with the
+    child and leaves each a private empty top layer, so neither sees the
+    other's later trades; branching again before trading adds no layers
+    """
+
+    def __init__(self, balance_data, assets=None):
+        if not isinstance(balance_data, ChainMap):
+            balance_data = ChainMap({}, balance_data)
+        self.pools = balance_data
+        if assets is None:
+            assets = AssetRegistry(getattr(rpc_get_objects, "cache", {}))
+        self.assets = assets
+
+    def branch(self):
+        """
+        A child state sharing every pool with this one until either trades
+        """
+        if self.pools.maps[0]:
+            # freeze the trades so far, only an empty top layer stays private
+            self.pools = self.pools.new_child()
+        return PoolSimulator(self.pools.parents.new_child(), self.assets)
+
+    def changes(self):
+        """
+        Pools this state has traded against since it was created or last branched
+        """
+        return self.pools.maps[0]
+
+    def quote(self, pool_id, sell_asset, amount):
+        """
+        Exact output of selling amount into a pool and the pool tuple afterwards
+        """
+        bal_a, bal_b, asset_a, asset_b, fee, withdrawal_fee = self.pools[pool_id]
+        if sell_asset == asset_a:
+            sell, receive, balance_sell, balance_receive = asset_a, asset_b, bal_a, bal_b
+        else:
+            sell, receive, balance_sell, balance_receive = asset_b, asset_a, bal_b, bal_a
+        sell, receive = self.assets.by_instance[sell], self.assets.by_instance[receive]
+        sell_p = sell.scale
+        receive_p = receive.scale
+
+        # the chain only moves whole satoshis
+        amount = Decimal(int(Decimal(str(amount)) * sell_p)) / sell_p
+        pool = {
+            "balance_sell": round(balance_sell * sell_p),
+            "balance_receive": round(balance_receive * receive_p),
+            "asset_sell": sell.object,
+            "asset_receive": receive.object,
+            "taker_fee_percent": round(fee * 100),
+        }
+        exchange = calculate_exchange(amount, pool, "sell", "receive")
+        if exchange["min_receive_sat"] <= 0:
+            return 0.0, self.pools[pool_id]
+
+        balance_sell = (pool["balance_sell"] + int(exchange["balance_sell_delta"])) / sell_p
+        balance_receive = (
+            pool["balance_receive"] + int(exchange["balance_receive_delta"])
+        ) / receive_p
+        if sell_asset == asset_a:
+            after = (balance_sell, balance_receive, asset_a, asset_b, fee, withdrawal_fee)
+        else:
+            after = (balance_receive, balance_sell, asset_a, asset_b, fee, withdrawal_fee)
+        return float(exchange["min_to_receive"]), after
+
+    def swap(self, pool_id, sell_asset, amount):
+        """
+        Sell amount into a pool, update its balances and return the output
+        """
+        received, after = self.quote(pool_id, sell_asset, amount)
+        if received:
+            self.pools[pool_id] = after
+        return received
+
+    def trade_route(self, amount, token_path, pool_path):
+        """
+        Trade along a route, each hop selling the previous hop's output
+        """
+        for sell, pool_id in zip(token_path, pool_path):
+            amount = self.swap(pool_id, sell, amount)
+        return amount
+
+    def replay(self, trades):
+        """
+        Apply a sequence of (pool_id, sell_asset, amount) trades in order
+        """
+        return [self.swap(pool_id, sell_asset, amount) for pool_id, sell_asset, amount in trades]
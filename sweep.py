@@ -0,0 +1,155 @@
+"""
+Price impact sweeps over a grid of input amounts.
+
+Rather than re-running the whole analysis once per size, a route is quoted for
+every amount on the grid in one vectorized pass through its pools, giving the
+price impact curve and the size at which slippage crosses a threshold.
+"""
+
+import numpy as np
+
+from assets import AssetRegistry
+from min_to_receive import calculate_min_to_receive_batch
+from poolmap import bootstrap_prices_from_core
+from rpc import rpc_get_objects
+
+
+def amount_grid(low, high, count=200):
+    """
+    Log spaced input amounts, denser where small trades live
+    """
+    return np.geomspace(low, high, count)
+
+
+def route_outputs(amounts, token_path, pool_path, balance_data, assets=None):
+    """
+    Output of a route for every input amount, hop by hop in one batch per pool
+    ~
+    assets is the AssetRegistry the route was found with, its records holding
+    the chain objects; without one, a registry is built from the object cache
+    """
+    if assets is None:
+        assets = AssetRegistry(getattr(rpc_get_objects, "cache", {}))
+    outputs = np.asarray(amounts, dtype=float)
+    for (sell, receive), pool_id in zip(zip(token_path, token_path[1:]), pool_path):
+        bal_a, bal_b, asset_a, _, fee, _ = balance_data[pool_id]
+        balance_sell, balance_receive = (bal_a, bal_b) if sell == asset_a else (bal_b, bal_a)
+        sell, receive = assets.by_instance[sell], assets.by_instance[receive]
+        outputs = calculate_min_to_receive_batch(
+            outputs,
+            # rounded as quote_exchange does, so both engines see the same pool
+            round(balance_sell * sell.scale),
+            round(balance_receive * receive.scale),
+            sell.object,
+            receive.object,
+            round(fee * 100),
+        )
+    return outputs
+
+
+def route_spot_rate(token_path, pool_path, balance_data):
+    """
+    Fee free output per unit input of an infinitesimal trade along the route
+    """
+    rate = 1.0
+    for sell, pool_id in zip(token_path, pool_path):
+        bal_a, bal_b, asset_a, _, _, _ = balance_data[pool_id]
+        rate *= (bal_b / bal_a) if sell == asset_a else (bal_a / bal_b)
+    return rate
+
+
+def threshold_size(amounts, impact, threshold):
+    """
+    Input amount at which price impact crosses the threshold for good,
+    interpolated on the log amount grid; None if the grid ends below it
+    ~
+    satoshi rounding makes impact jump around at small sizes, so the crossing
+    is taken after the last grid point below the threshold, not the first
+    point above it
+    """
+    below = np.nonzero(impact < threshold)[0]
+    if not len(below):
+        return float(amounts[0])
+    idx = below[-1] + 1
+    if idx == len(amounts):
+        return None
+    low, high = np.log(amounts[idx - 1]), np.log(amounts[idx])
+    share = (threshold - impact[idx - 1]) / (impact[idx] - impact[idx - 1])
+    return float(np.exp(low + share * (high - low)))
+
+
+def impact_curve(amounts, outputs, spot_rate, threshold):
+    """
+    Package outputs of a sweep as a price impact curve
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    prices = outputs / amounts
+    impact = 1 - prices / spot_rate
+    return {
+        "amounts": amounts,
+        "outputs": outputs,
+        "prices": prices,
+        "impact": impact,
+        "threshold": threshold,
+        "threshold_size": threshold_size(amounts, impact, threshold),
+    }
+
+
+def sweep_route(token_path, pool_path, balance_data, amounts, threshold=0.01, assets=None):
+    """
+    Price impact curve of one fixed route over a grid of input amounts
+    """
+    outputs = route_outputs(amounts, token_path, pool_path, balance_data, assets)
+    curve = impact_curve(
+        amounts, outputs, route_spot_rate(token_path, pool_path, balance_data), threshold
+    )
+    curve["routes"] = [(token_path, pool_path)]
+    curve["route_index"] = np.zeros(len(curve["amounts"]), dtype=int)
+    return curve
+
+
+def sweep_best_routes(
+    rpc,
+    G,
+    balance_data,
+    from_id,
+    to_id,
+    amounts,
+    cer_prices=None,
+    threshold=0.01,
+    probes=5,
+    assets=None,
+):
+    """
+    Price impact curve following the best route at each input amount
+    ~
+    the route search runs only at a few probe sizes across the grid; every route
+    it finds is then quoted over the whole grid in one batch and the best output
+    is taken per amount
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    routes = []
+    for probe in np.unique(np.linspace(0, len(amounts) - 1, probes).astype(int)):
+        _, token_paths, pool_paths = bootstrap_prices_from_core(
+            rpc, amounts[probe], G, from_id, cer_prices=cer_prices, target=to_id, assets=assets
+        )
+        if to_id not in token_paths:
+            continue
+        route = (token_paths[to_id], pool_paths[to_id])
+        # order book hops have no pool balances to sweep
+        if route not in routes and all(pool in balance_data for pool in route[1]):
+            routes.append(route)
+    if not routes:
+        return None
+
+    outputs = np.vstack(
+        [route_outputs(amounts, *route, balance_data, assets) for route in routes]
+    )
+    best = np.argmax(outputs, axis=0)
+    best_outputs = outputs[best, np.arange(len(amounts))]
+    # impact is measured against the best fee free spot rate among the routes
+    spot_rate = max(route_spot_rate(*route, balance_data) for route in routes)
+    curve = impact_curve(amounts, best_outputs, spot_rate, threshold)
+    curve["routes"] = routes
+    curve["route_index"] = best
+    return curve
@@ -0,0 +1,121 @@
+"""
+Build liquidity pool exchange transactions from routing quotes.
+
+The per hop quotes computed during analysis already hold every amount and
+precision a transaction needs, so no RPC round trips are made here.  Many
+swaps can be packed into batched transaction files in one call.
+"""
+
+import json
+import math
+import time
+from datetime import datetime, timedelta, timezone
+
+LIQUIDITY_POOL_EXCHANGE = 63
+
+
+def route_operations(account_id, hops, slippage=0.005, fee_amount="100000"):
+    """
+    Pool exchange operations for one quoted route
+    ~
+    hops come from poolmap.quote_route, each quoted at exactly the satoshis it
+    sells, which are exactly the satoshis the hop before it is quoted to
+    deliver.  The slippage tolerance is applied once, to the final hop, so it
+    bounds the whole route rather than compounding per hop; intermediate hops
+    must deliver their exact quote, and a pool that moved against the route
+    fails the transaction instead of leaving part of an intermediate asset
+    behind
+    """
+    operations = []
+    for index, hop in enumerate(hops):
+        amount_to_sell = hop["amount_to_sell_sat"]
+        tolerance = slippage if index == len(hops) - 1 else 0
+        min_to_receive = max(1, math.floor(hop["expected_sat"] * (1 - tolerance)))
+        operations.append(
+            [
+                LIQUIDITY_POOL_EXCHANGE,
+                {
+                    "fee": {"amount": fee_amount, "asset_id": "1.3.0"},
+                    "account": account_id,
+                    "pool": hop["pool"],
+                    "amount_to_sell": {
+                        "amount": str(amount_to_sell),
+                        "asset_id": hop["asset_id_to_sell"],
+                    },
+                    "min_to_receive": {
+                        "amount": str(min_to_receive),
+                        "asset_id": hop["asset_id_to_receive"],
+                    },
+                    "extensions": [],
+                },
+            ]
+        )
+    return operations
+
+
+def transaction_payload(operations, expiration_hours=24):
+    """
+    Wrap operations in the injectedCall payload the wallet signs and broadcasts
+    """
+    expiration_time = (datetime.now(timezone.utc) + timedelta(hours=expiration_hours)).strftime(
+        "%Y-%m-%dT%H:%M:%S"
+    )
+    return {
+        "type": "api",
+        "id": f"{time.time()}-ehbxeor03-2",
+        "payload": {
+            "method": "injectedCall",
+            "params": [
+                "signAndBroadcast",
+                json.dumps(
+                    {
+                        "ref_block_num": 0,
+                        "ref_block_prefix": 0,
+                        "expiration": expiration_time,
+                        "operations": operations,
+                        "extensions": [],
+                        "signatures": [],
+                    }
+                ),
+                [],
+            ],
+            "appName": "Bitshares Astro UI",
+            "chain": "BTS",
+            "browser": "web browser",
+            "origin": "vaulta-exchange-haven.vercel.app",
+            "memo": False,
+        },
+    }
+
+
+def build_transactions(account_id, routes, slippage=0.005, max_operations=50):
+    """
+    Pack the operations of many quoted routes into as few transactions as fit
+    ~
+    a route is never split across transactions, so each swap stays atomic
+    """
+    transactions = []
+    batch = []
+    for hops in routes:
+        operations = route_operations(account_id, hops, slippage)
+        if batch and len(batch) + len(operations) > max_operations:
+            transactions.append(transaction_payload(batch))
+            batch = []
+        batch.extend(operations)
+    if batch:
+        transactions.append(transaction_payload(batch))
+    return transactions
+
+
+def save_transactions(transactions, prefix="transaction"):
+    """
+    Write transactions to prefix.json, or prefix_1.json, prefix_2.json, ... for batches
+    """
+    if len(transactions) == 1:
+        names = [f"{prefix}.json"]
+    else:
+        names = [f"{prefix}_{num}.json" for num in range(1, len(transactions) + 1)]
+    for name, transaction in zip(names, transactions):
+        with open(name, "w") as f:
+            json.dump(transaction, f, indent=2)
+    return names
@@ -0,0 +1,308 @@
+"""
+Keep routes for a fixed watchlist of pairs precomputed in the background.
+
+Each cycle refetches the watched network's pool balances, finds the pools
+whose balances moved and recomputes only the watched pairs whose routes run
+through them, most important pairs first, until the cycle's CPU budget is
+spent; whatever is left carries over to the next cycle.  A lookup for a
+watched pair is then a dictionary read instead of a full analysis.
+
+    scheduler = WatchlistScheduler([("XBTSX.USDT", "HONEST.MONEY", 100, 10)])
+    scheduler.start()
+    scheduler.lookup("XBTSX.USDT", "HONEST.MONEY")
+"""
+
+# STANDARD PYTHON MODULES
+import heapq
+import logging
+import threading
+import time
+
+# BITSHARES NETWORK MODULES
+from assets import AssetRegistry
+from poolmap import (
+    bootstrap_prices_from_core,
+    build_graph,
+    fetch_balance_data,
+    load_mock_pool_data,
+    load_mock_precisions,
+    load_pool_data,
+    load_precisions,
+    pool_liquidity,
+    prune_pools,
+    route_between,
+    stream_prices_from_core,
+)
+from rpc import get_liquidity_pool_volume, wss_handshake
+
+logger = logging.getLogger(__name__)
+
+
+def routable(balance_data):
+    """
+    Pools with both balances non-zero, the ones build_graph adds as edges
+    """
+    return {pool_id for pool_id, pool in balance_data.items() if pool[0] and pool[1]}
+
+
+class WatchEntry:
+    """
+    One watched pair; route holds the last computed result, or None
+    """
+
+    __slots__ = ("from_token", "to_token", "from_id", "to_id", "amount", "priority", "route")
+
+    def __init__(self, from_token, to_token, from_id, to_id, amount=1, priority=1):
+        self.from_token = from_token
+        self.to_token = to_token
+        self.from_id = from_id
+        self.to_id = to_id
+        self.amount = amount
+        self.priority = priority
+        self.route = None
+
+    @property
+    def key(self):
+        return (self.from_token, self.to_token)
+
+
+class WatchlistScheduler:
+    """
+    Background recomputation of watchlist routes as pool balances change
+    ~
+    watchlist is an iterable of (from_symbol, to_symbol[, amount[, priority]]);
+    budget is the CPU seconds spent on routing per cycle, interval the seconds
+    between cycles.  Routes only depend on the pools they run through, so a
+    change elsewhere can leave a better route unnoticed; max_age bounds how
+    long any route goes before it is recomputed regardless.  prune is the
+    (min_tvl, min_volume) of generate_all_prices, with the same fallback to
+    the full graph for pairs the pruned graph cannot reach; max_hops routes
+    each pair with the hop-bounded route_between instead of a shared search
+    """
+
+    def __init__(
+        self,
+        watchlist,
+        rpc=None,
+        pool_data=None,
+        precisions=None,
+        assets=None,
+        interval=3,
+        budget=0.5,
+        max_age=300,
+        prune=None,
+        mock=False,
+        max_hops=None,
+    ):
+        if mock:
+            pool_data = load_mock_pool_data()
+            precisions = load_mock_precisions()
+        else:
+            pool_data = pool_data if pool_data is not None else load_pool_data()
+            if precisions is None:
+                precisions = assets.precisions() if assets is not None else load_precisions()
+            if rpc is None:
+                rpc = wss_handshake()
+        self.rpc = rpc
+        self.mock = mock
+        self.pools = [pool[0] for pool in pool_data]
+        self.cache = precisions
+        self.assets = assets if assets is not None else AssetRegistry(precisions)
+        self.interval = interval
+        self.budget = budget
+        self.max_age = max_age
+        self.prune = prune
+        self.max_hops = max_hops
+
+        self.entries = {}
+        for item in watchlist:
+            from_token, to_token, *rest = item
+            from_asset = self.assets.find(from_token)
+            to_asset = self.assets.find(to_token)
+            if from_asset is None or to_asset is None:
+                logger.warning(f"Skipping unknown watchlist pair {from_token} -> {to_token}")
+                continue
+            entry = WatchEntry(
+                from_asset.symbol, to_asset.symbol, from_asset.instance, to_asset.instance, *rest
+            )
+            self.entries[entry.key] = entry
+
+        self.routes = {}
+        self.dirty = set(self.entries)
+        self.balance_data = {}
+        self.graph = None
+        self.pruned = None
+        self.cer_prices = None
+        self.lock = threading.Lock()
+        self.closed = False
+        self.thread = None
+
+    def lookup(self, from_token, to_token):
+        """
+        The latest route for a watched pair as a dict of price, token_path,
+        pool_path and updated, or None if it has not been computed yet;
+        symbols resolve case-insensitively, as the watchlist's do
+        """
+        from_asset = self.assets.find(from_token)
+        to_asset = self.assets.find(to_token)
+        if from_asset is None or to_asset is None:
+            return None
+        return self.routes.get((from_asset.symbol, to_asset.symbol))
+
+    def refresh(self):
+        """
+        Refetch pool balances and mark the watched pairs they invalidate
+        ~
+        returns the set of pools whose balances changed, appeared or vanished;
+        pairs without a route are retried whenever a pool becomes routable
+        """
+        balance_data, self.assets = fetch_balance_data(
+            self.rpc, self.pools, self.cache, self.assets, self.mock
+        )
+        changed = {
+            pool_id
+            for pool_id in balance_data.keys() | self.balance_data.keys()
+            if balance_data.get(pool_id) != self.balance_data.get(pool_id)
+        }
+        opened = set()
+        if changed or self.graph is None:
+            opened = routable(balance_data) - routable(self.balance_data)
+            self.balance_data = balance_data
+            self.graph = build_graph(balance_data)
+            # the fee-free pass that every route's slippage is measured against
+            self.cer_prices, _, _ = bootstrap_prices_from_core(
+                self.rpc, 1, self.graph, base_token=0, assets=self.assets
+            )
+            self.pruned = None
+            if self.prune is not None:
+                min_tvl, min_volume = self.prune
+                volumes = None
+                if not self.mock and min_volume:
+                    volumes = get_liquidity_pool_volume(self.rpc, self.pools)
+                liquidity = pool_liquidity(balance_data, self.cer_prices, volumes, self.assets)
+                self.pruned = build_graph(
+                    prune_pools(balance_data, liquidity, min_tvl, min_volume)
+                )
+
+        now = time.time()
+        with self.lock:
+            for key, entry in self.entries.items():
+                route = entry.route
+                if (
+                    route is None
+                    or now - route["updated"] > self.max_age
+                    or not changed.isdisjoint(route["pool_path"])
+                    or (opened and not route["pool_path"])
+                ):
+                    self.dirty.add(key)
+        return changed
+
+    def _route(self, graph, source, amount, targets):
+        """
+        One search from source settling as many of targets as it can reach
+        """
+        found = {}
+        if self.max_hops is not None:
+            for target in targets:
+                route = route_between(
+                    self.rpc,
+                    amount,
+                    graph,
+                    source,
+                    target,
+                    self.max_hops,
+                    self.cer_prices,
+                    self.assets,
+                )
+                if route is not None:
+                    found[target] = route
+            return found
+
+        for asset, price, token_path, pool_path in stream_prices_from_core(
+            self.rpc, amount, graph, source, self.cer_prices, self.assets
+        ):
+            if asset in targets:
+                found[asset] = (price, token_path, pool_path)
+                if len(found) == len(targets):
+                    break
+        return found
+
+    def run_cycle(self):
+        """
+        Refresh balances then recompute dirty pairs, highest priority and
+        stalest first, until the CPU budget is spent; returns how many were done
+        ~
+        the budget is this thread's CPU time, so analyses running in other
+        threads of the same process do not eat into it
+        """
+        self.refresh()
+        with self.lock:
+            queue = [
+                (-entry.priority, entry.route["updated"] if entry.route else 0, key)
+                for key, entry in self.entries.items()
+                if key in self.dirty
+            ]
+        heapq.heapify(queue)
+
+        done = 0
+        deadline = time.thread_time() + self.budget
+        while queue and time.thread_time() < deadline:
+            key = heapq.heappop(queue)[2]
+            if key not in self.dirty:
+                continue
+            entry = self.entries[key]
+            # one search from a source prices every dirty pair that shares it
+            group = [
+                other
+                for other in self.entries.values()
+                if other.key in self.dirty
+                and other.from_id == entry.from_id
+                and other.amount == entry.amount
+            ]
+            targets = {other.to_id for other in group}
+            found = {}
+            if self.pruned is not None:
+                found = self._route(self.pruned, entry.from_id, entry.amount, targets)
+            if len(found) < len(targets):
+                found.update(
+                    self._route(self.graph, entry.from_id, entry.amount, targets - found.keys())
+                )
+
+            now = time.time()
+            with self.lock:
+                for other in group:
+                    price, token_path, pool_path = found.get(other.to_id, (None, [], []))
+                    other.route = {
+                        "price": price,
+                        "token_path": token_path,
+                        "pool_path": pool_path,
+                        "updated": now,
+                    }
+                    self.routes[other.key] = other.route
+                    self.dirty.discard(other.key)
+            done += len(group)
+
+        if self.dirty:
+            logger.info(f"{len(self.dirty)} watched pairs left for the next cycle")
+        return done
+
+    def _loop(self):
+        while not self.closed:
+            started = time.time()
+            try:
+                self.run_cycle()
+            except Exception as error:
+                logger.warning(f"Watchlist cycle failed: {error}")
+            time.sleep(max(0, self.interval - (time.time() - started)))
+
+    def start(self):
+        """
+        Run cycles in a background thread until stop
+        """
+        self.closed = False
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.closed = True